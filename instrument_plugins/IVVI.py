@@ -175,8 +175,7 @@ class IVVI(Instrument):
             None
         '''
         logging.info('Get all')
-        for i in range(self._numdacs):
-            self.get('dac%d' % (i+1))
+        self.get(['dac%d' % (i+1) for i in range(self._numdacs)])
 
     def set_dacs_zero(self):
         for i in range(self._numdacs):
@@ -224,6 +223,25 @@ class IVVI(Instrument):
         mvoltages = self._get_dacs()
         return mvoltages[channel - 1]
 
+    def do_get_many(self, names):
+        '''
+        Returns the values of several dacs, read from the device at once
+
+        Input:
+            names (list of strings) : parameter names
+
+        Output:
+            values (dict) : dacvalues in mV of the dac parameters in names
+        '''
+        logging.debug('Reading %s', ', '.join(names))
+        mvoltages = self._get_dacs()
+        values = {}
+        for name in names:
+            opts = self.get_parameter_options(name)
+            if opts.get('base_name') == 'dac':
+                values[name] = mvoltages[opts['channel'] - 1]
+        return values
+
     def do_set_dac(self, mvoltage, channel):
         '''
         Sets the specified dac to the specified voltage
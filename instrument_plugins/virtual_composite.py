@@ -15,7 +15,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from instrument import Instrument
+from instrument import Instrument, wait_futures
 import types
 
 class virtual_composite(Instrument):
@@ -128,10 +128,15 @@ class virtual_composite(Instrument):
         return ret
 
     def _set_combined(self, varname, val):
+        # Ramp the variables concurrently where possible
         info = self._combine_info[varname]
+        futures = []
         for pinfo in info:
             newval = val * pinfo['scale'] - pinfo['offset']
-            pinfo['instrument'].set(pinfo['parameter'], newval)
+            futures.append(pinfo['instrument'].ramp(pinfo['parameter'], newval))
+        wait_futures(futures)
+        for future in futures:
+            future.result()
 
 
     def _instrument_changed_cb(self, sender, changes):
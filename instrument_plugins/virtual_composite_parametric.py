@@ -15,7 +15,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from instrument import Instrument
+from instrument import Instrument, wait_futures
 import types
 
 class virtual_composite_parametric(Instrument):
@@ -91,10 +91,15 @@ class virtual_composite_parametric(Instrument):
         return ret
 
     def _set_combined(self, varname, val):
+        # Ramp the variables concurrently where possible
         info = self._combine_info[varname]
+        futures = []
         for pinfo in info:
             newval = pinfo['function'](val) / pinfo['gain']
-            pinfo['instrument'].set(pinfo['parameter'], newval)
+            futures.append(pinfo['instrument'].ramp(pinfo['parameter'], newval))
+        wait_futures(futures)
+        for future in futures:
+            future.result()
 
 
     def _instrument_changed_cb(self, sender, changes):
@@ -17,6 +17,7 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
 import gobject
+import sys
 import os
 import os.path
 import time
@@ -27,11 +28,23 @@ import logging
 import copy
 import shutil
 import gzip
+import itertools
+import weakref
+import atexit
+import tempfile
+import collections
+import multiprocessing
+import multiprocessing.pool
 
 from gettext import gettext as _L
 
 from lib import namedlist, temp
 from lib.misc import dict_to_ordered_tuples, get_arg_type
+from lib.file_support.datawriter import BufferedWriter, StreamCompressor, \
+        FileWriterThread
+from lib.file_support import datacache, datahdf5
+from lib.file_support.dataindex import BlockIndex
+from lib.file_support.datapyramid import Pyramid
 from lib.config import get_config, get_shared_config
 config = get_config()
 shared_config = get_shared_config()
@@ -143,6 +156,584 @@ class IncrementalGenerator:
         self._counter += 1
         return fn
 
+# In-memory storage
+
+def _spill_buffer(buf, n, fn):
+    '''
+    Copy the first n rows of buffer 'buf' to file fn and return a writable
+    memory map of it with the same capacity as buf.
+    '''
+
+    mm = numpy.memmap(fn, mode='w+', dtype=buf.dtype, shape=buf.shape)
+    mm[:n] = buf[:n]
+    mm.flush()
+    return mm
+
+def _grow_spilled(mm, capacity):
+    '''
+    Grow memory map 'mm' to 'capacity' rows. The file is extended, so the
+    rows do not have to be copied.
+    '''
+
+    mm.flush()
+    return numpy.memmap(mm.filename, mode='r+', dtype=mm.dtype,
+            shape=(capacity, ) + mm.shape[1:])
+
+class _ArrayStore:
+    '''
+    Growable 2D array used as in-memory storage of a Data object.
+
+    Rows are appended into a preallocated buffer whose capacity is doubled
+    when it is full, so appending a point is amortized O(1). get_view()
+    returns a view of the filled region of the buffer. After spill() the
+    buffer is a memory-mapped file, which is grown the same way.
+    '''
+
+    _MIN_CAPACITY = 64
+
+    def __init__(self, data=None):
+        if data is None:
+            data = numpy.array([])
+        self.set(data)
+
+    def __len__(self):
+        return self._n
+
+    def set(self, data):
+        '''
+        Use array 'data' as the contents of the store. The array is not
+        copied; it will be reallocated when rows are appended.
+        '''
+        self._buffer = data
+        self._n = len(data)
+        self._spilled = False
+
+    def get_view(self):
+        '''Return a view of the filled region.'''
+        if self._n == len(self._buffer):
+            return self._buffer
+        return self._buffer[:self._n]
+
+    def get_capacity(self):
+        '''Return the number of rows that fit in the current buffer.'''
+        return len(self._buffer)
+
+    def append(self, rows):
+        '''
+        Append rows (a 2D array) to the store. The buffer dtype is promoted
+        if necessary, as numpy.append would do.
+        '''
+
+        rows = numpy.asarray(rows)
+        nrows = len(rows)
+        if self._n == 0:
+            dtype = rows.dtype
+        else:
+            dtype = numpy.result_type(self._buffer.dtype, rows.dtype)
+
+        needed = self._n + nrows
+        if self._n == 0 or dtype != self._buffer.dtype or \
+                needed > len(self._buffer) or \
+                self._buffer.shape[1:] != rows.shape[1:]:
+            self._grow(needed, dtype, rows.shape[1:])
+
+        self._buffer[self._n:needed] = rows
+        self._n = needed
+
+    def _grow(self, needed, dtype, rowshape):
+        capacity = max(needed, 2 * len(self._buffer), self._MIN_CAPACITY)
+        if self._spilled and dtype == self._buffer.dtype and \
+                tuple(rowshape) == self._buffer.shape[1:]:
+            self._buffer = _grow_spilled(self._buffer, capacity)
+            return
+
+        self._spilled = False
+        buf = numpy.empty((capacity, ) + tuple(rowshape), dtype=dtype)
+        if self._n > 0:
+            buf[:self._n] = self._buffer[:self._n]
+        self._buffer = buf
+
+    def get_nbytes(self):
+        '''Return the number of bytes held in memory.'''
+        if isinstance(self._buffer, numpy.memmap):
+            return 0
+        return self._buffer.nbytes
+
+    def is_spilled(self):
+        return isinstance(self._buffer, numpy.memmap)
+
+    def spill(self, filepath):
+        '''
+        Move the buffer, including its free capacity, to file filepath and
+        replace it by a memory map of that file. Returns the list of files
+        written.
+        '''
+
+        fn = filepath + '.mmap'
+        self._buffer = _spill_buffer(self._buffer, self._n, fn)
+        self._spilled = True
+        return [fn]
+
+class _ColumnStore:
+    '''
+    Growable columnar storage with a separate dtype for every column, used
+    as in-memory storage of a Data object when columns declare a dtype.
+
+    Every column is a 1D buffer whose capacity is doubled when full.
+    get_view() combines the columns into a 2D array of the promoted dtype;
+    this is a copy that is kept until rows are added.
+    '''
+
+    _MIN_CAPACITY = 64
+
+    def __init__(self, dtypes):
+        self._dtypes = [numpy.dtype(dt) for dt in dtypes]
+        self._columns = [numpy.empty(self._MIN_CAPACITY, dtype=dt) \
+                for dt in self._dtypes]
+        self._n = 0
+        self._combined = None
+        self._spilled = False
+
+    def __len__(self):
+        return self._n
+
+    def get_dtypes(self):
+        return self._dtypes
+
+    def set(self, data):
+        '''Use the columns of 2D array 'data', converted to the dtypes.'''
+        self._columns = [numpy.array(data[:, i], dtype=dt) \
+                for i, dt in enumerate(self._dtypes)]
+        self._n = len(data)
+        self._combined = None
+        self._spilled = False
+
+    def get_column(self, col):
+        '''Return a view of column col with its own dtype.'''
+        return self._columns[col][:self._n]
+
+    def get_view(self):
+        '''Return all columns as a 2D array of the promoted dtype.'''
+        if self._combined is None or len(self._combined) != self._n:
+            dtype = numpy.result_type(*self._dtypes)
+            combined = numpy.empty((self._n, len(self._dtypes)), dtype=dtype)
+            for i in range(len(self._dtypes)):
+                combined[:, i] = self._columns[i][:self._n]
+            self._combined = combined
+        return self._combined
+
+    def get_capacity(self):
+        return len(self._columns[0])
+
+    def get_nbytes(self):
+        '''Return the number of bytes held in memory.'''
+        nbytes = 0
+        for col in self._columns:
+            if not isinstance(col, numpy.memmap):
+                nbytes += col.nbytes
+        if self._combined is not None:
+            nbytes += self._combined.nbytes
+        return nbytes
+
+    def is_spilled(self):
+        return isinstance(self._columns[0], numpy.memmap)
+
+    def spill(self, filepath):
+        '''
+        Move every column, including its free capacity, to a file and
+        memory-map it.
+        '''
+
+        files = []
+        for i in range(len(self._columns)):
+            fn = '%s.%d.mmap' % (filepath, i)
+            self._columns[i] = _spill_buffer(self._columns[i], self._n, fn)
+            files.append(fn)
+        self._combined = None
+        self._spilled = True
+        return files
+
+    def append(self, rows):
+        '''Append rows (a 2D array), converting each column to its dtype.'''
+
+        rows = numpy.asarray(rows)
+        needed = self._n + len(rows)
+        if needed > len(self._columns[0]):
+            capacity = max(needed, 2 * len(self._columns[0]))
+            for i, col in enumerate(self._columns):
+                if self._spilled:
+                    self._columns[i] = _grow_spilled(col, capacity)
+                    continue
+                buf = numpy.empty(capacity, dtype=col.dtype)
+                buf[:self._n] = col[:self._n]
+                self._columns[i] = buf
+
+        for i, col in enumerate(self._columns):
+            col[self._n:needed] = rows[:, i]
+        self._n = needed
+        self._combined = None
+
+class _GridStore:
+    '''
+    Preallocated N-D grid used as in-memory storage of a Data object in
+    grid mode.
+
+    The grid has one axis per coordinate, the first coordinate being the
+    innermost (fastest changing) loop, and is filled with NaN. Points are
+    stored in order of arrival, or at an explicit grid index with put(), so
+    adding a point is O(1) and the data never has to be reshaped. The two
+    can not be mixed.
+    '''
+
+    def __init__(self, shape, ncols):
+        self._shape = tuple(shape)
+        self._buffer = numpy.empty((int(numpy.prod(shape)), ncols))
+        self._buffer.fill(numpy.nan)
+        self._n = 0
+        self._indexed = False
+
+    def __len__(self):
+        return self._n
+
+    def get_shape(self):
+        '''Return the loop sizes of the grid, innermost loop first.'''
+        return self._shape
+
+    def get_view(self):
+        '''Return a 2D view of the rows up to the last filled one.'''
+        return self._buffer[:self._n]
+
+    def get_grid(self):
+        '''Return an N-D view of the whole grid, indexed like the shape.'''
+        ndim = len(self._shape)
+        grid = self._buffer.reshape(self._shape[::-1] + (-1, ))
+        return grid.transpose(range(ndim)[::-1] + [ndim])
+
+    def get_capacity(self):
+        return len(self._buffer)
+
+    def get_nbytes(self):
+        if isinstance(self._buffer, numpy.memmap):
+            return 0
+        return self._buffer.nbytes
+
+    def is_spilled(self):
+        return isinstance(self._buffer, numpy.memmap)
+
+    def spill(self, filepath):
+        '''Save the grid to a .npy file and memory-map it.'''
+        fn = filepath + '.npy'
+        numpy.save(fn, self._buffer)
+        self._buffer = numpy.load(fn, mmap_mode='r+')
+        return [fn]
+
+    def append(self, rows):
+        '''Store rows after the last filled row.'''
+        if self._indexed:
+            raise ValueError('points were added by grid index before')
+        rows = numpy.asarray(rows)
+        needed = self._n + len(rows)
+        if needed > len(self._buffer):
+            raise IndexError('Grid is full')
+        self._buffer[self._n:needed] = rows
+        self._n = needed
+
+    def put(self, index, row):
+        '''Store a single row at grid index 'index'.'''
+        if self._n > 0 and not self._indexed:
+            raise ValueError('points were added without grid index before')
+        pos = numpy.ravel_multi_index(tuple(index)[::-1], self._shape[::-1])
+        self._indexed = True
+        self._buffer[pos] = row
+        self._n = max(self._n, pos + 1)
+
+class _ColumnStats:
+    '''
+    Running statistics of the columns of a data set, updated as rows are
+    added: count (of non-NaN values), number of NaNs, min, max, sum, sum
+    of squares and the first and last value.
+
+    Added rows are collected and folded into the statistics in batches, so
+    adding a single row stays cheap.
+    '''
+
+    _BATCH = 1024
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._ncols = None
+        self._pending = []
+        self._npending = 0
+
+    def update(self, rows):
+        '''Add the rows of 2D array 'rows' to the statistics.'''
+
+        if len(rows) == 0:
+            return
+        self._pending.append(rows)
+        self._npending += len(rows)
+        if self._npending >= self._BATCH:
+            self._fold()
+
+    def _fold(self):
+        if self._npending == 0:
+            return
+        rows = numpy.concatenate(self._pending).astype(numpy.float64)
+        self._pending = []
+        self._npending = 0
+        nan = numpy.isnan(rows)
+        clean = numpy.where(nan, 0.0, rows)
+
+        if self._ncols != rows.shape[1]:
+            self._ncols = rows.shape[1]
+            self._count = numpy.zeros(self._ncols, dtype=numpy.int64)
+            self._nans = numpy.zeros(self._ncols, dtype=numpy.int64)
+            self._min = numpy.empty(self._ncols)
+            self._min.fill(numpy.inf)
+            self._max = -self._min
+            self._sum = numpy.zeros(self._ncols)
+            self._sumsq = numpy.zeros(self._ncols)
+            self._first = rows[0].copy()
+
+        nans = nan.sum(axis=0)
+        self._nans += nans
+        self._count += len(rows) - nans
+        self._min = numpy.minimum(self._min,
+                numpy.where(nan, numpy.inf, rows).min(axis=0))
+        self._max = numpy.maximum(self._max,
+                numpy.where(nan, -numpy.inf, rows).max(axis=0))
+        self._sum += clean.sum(axis=0)
+        self._sumsq += (clean * clean).sum(axis=0)
+        self._last = rows[-1].copy()
+
+    def get(self):
+        '''Return a list with a dictionary of statistics per column.'''
+
+        self._fold()
+        if self._ncols is None:
+            return []
+
+        ret = []
+        for i in range(self._ncols):
+            count = int(self._count[i])
+            stats = {
+                'count': count,
+                'nan_count': int(self._nans[i]),
+                'sum': float(self._sum[i]),
+                'sum_squares': float(self._sumsq[i]),
+                'first': float(self._first[i]),
+                'last': float(self._last[i]),
+            }
+            if count > 0:
+                mean = self._sum[i] / count
+                var = max(self._sumsq[i] / count - mean * mean, 0)
+                stats['min'] = float(self._min[i])
+                stats['max'] = float(self._max[i])
+                stats['mean'] = float(mean)
+                stats['std'] = float(numpy.sqrt(var))
+            else:
+                stats['min'] = stats['max'] = None
+                stats['mean'] = stats['std'] = None
+            ret.append(stats)
+
+        return ret
+
+class _MemoryBudget:
+    '''
+    Keep track of the memory used by the in-memory data of all Data
+    objects, least recently used first.
+
+    When the total exceeds 'data_memory_budget' from config (in MB, None
+    for no limit), the data of the least recently used objects is spilled
+    to a .npy file in 'data_spilldir' (default the temp dir) and replaced
+    by a memory map of that file, so it is reloaded transparently when
+    accessed. Objects that are closed and have not been accessed for
+    'data_memory_idle' seconds (None to disable) are spilled as well. Data
+    objects with an open data file are never spilled.
+    '''
+
+    def __init__(self):
+        self._objects = collections.OrderedDict()
+        self._access = {}
+        self._last = None
+        self._spillfiles = []
+        self._counter = itertools.count()
+        atexit.register(self._cleanup)
+
+    def register(self, obj):
+        key = id(obj)
+        self._objects[key] = weakref.ref(obj,
+                lambda ref, key=key: self._remove(key))
+        self._access[key] = time.time()
+
+    def _remove(self, key):
+        self._objects.pop(key, None)
+        self._access.pop(key, None)
+        if self._last == key:
+            self._last = None
+
+    def touch(self, obj):
+        '''Mark obj as most recently used.'''
+        key = id(obj)
+        if key != self._last:
+            ref = self._objects.pop(key, None)
+            if ref is None:
+                return
+            self._objects[key] = ref
+            self._last = key
+        self._access[key] = time.time()
+
+    def get_budget(self):
+        '''Return the budget in bytes, or None.'''
+        budget = config.get('data_memory_budget', None)
+        if budget is None:
+            return None
+        return int(budget * 1024 * 1024)
+
+    def _get_objects(self):
+        objs = []
+        for ref in self._objects.values():
+            obj = ref()
+            if obj is not None:
+                objs.append(obj)
+        return objs
+
+    def get_report(self):
+        '''
+        Return a dictionary with the budget, the total number of bytes in
+        memory and a list with the memory usage of each Data object, least
+        recently used first.
+        '''
+
+        now = time.time()
+        objects = []
+        total = 0
+        for obj in self._get_objects():
+            usage = obj.get_memory_usage()
+            usage['idle'] = now - self._access.get(id(obj), now)
+            objects.append(usage)
+            total += usage['nbytes']
+
+        return {
+            'budget': self.get_budget(),
+            'nbytes': total,
+            'objects': objects,
+        }
+
+    def check(self):
+        '''Spill data of objects as required by the budget.'''
+
+        budget = self.get_budget()
+        idle = config.get('data_memory_idle', None)
+        if budget is None and idle is None:
+            return
+
+        now = time.time()
+        objs = self._get_objects()
+        total = sum([obj._store.get_nbytes() for obj in objs])
+        for obj in objs:
+            if budget is not None and total > budget:
+                spill = True
+            elif idle is not None and \
+                    now - self._access.get(id(obj), now) > idle:
+                spill = True
+            else:
+                spill = False
+
+            if spill and obj._can_spill():
+                before = obj._store.get_nbytes()
+                obj._spill()
+                total -= before - obj._store.get_nbytes()
+
+    def get_spill_filepath(self, obj):
+        '''Return a new path (without extension) to spill data of obj to.'''
+        spilldir = config.get('data_spilldir', None)
+        if spilldir is None:
+            spilldir = config.get('tempdir', None) or tempfile.gettempdir()
+        if not os.path.isdir(spilldir):
+            os.makedirs(spilldir)
+        return os.path.join(spilldir, 'qtlab_data_%d_%d_%d' % \
+                (os.getpid(), id(obj), self._counter.next()))
+
+    def add_spillfiles(self, files):
+        self._spillfiles.extend(files)
+
+    def remove_spillfiles(self, files):
+        for fn in files:
+            try:
+                os.remove(fn)
+                self._spillfiles.remove(fn)
+            except (OSError, ValueError):
+                pass
+
+    def _cleanup(self):
+        self.remove_spillfiles(list(self._spillfiles))
+
+_memory = _MemoryBudget()
+
+def _clip_range(start, stop, n):
+    '''Return the (start, stop) indices a slice selects from n items.'''
+    if stop is None:
+        stop = n
+    if start < 0:
+        start += n
+    if stop < 0:
+        stop += n
+    return min(max(start, 0), n), min(max(stop, 0), n)
+
+class _FileRange:
+    '''
+    File-like object that reads lines of file f from the current position
+    up to byte offset 'end'.
+    '''
+
+    def __init__(self, f, end):
+        self._f = f
+        self._pos = f.tell()
+        self._end = end
+
+    def _clip(self, text):
+        text = text[:max(self._end - self._pos, 0)]
+        self._pos += len(text)
+        return text
+
+    def readline(self):
+        if self._pos >= self._end:
+            return ''
+        return self._clip(self._f.readline())
+
+    def readlines(self, sizehint=0):
+        if self._pos >= self._end:
+            return []
+        lines = []
+        for line in self._f.readlines(sizehint):
+            line = self._clip(line)
+            if line == '':
+                break
+            lines.append(line)
+        return lines
+
+def _get_complete_size(f):
+    '''Return the size of file f up to and including the last newline.'''
+
+    f.seek(0, 2)
+    pos = f.tell()
+    while pos > 0:
+        n = min(4096, pos)
+        f.seek(pos - n)
+        i = f.read(n).rfind('\n')
+        if i >= 0:
+            return pos - n + i + 1
+        pos -= n
+    return 0
+
+def _concatenate(arrays):
+    if len(arrays) == 1:
+        return arrays[0]
+    return numpy.concatenate(arrays)
+
 class _DataList(namedlist.NamedList):
     def __init__(self, time_name=False):
         namedlist.NamedList.__init__(self, base_name='data')
@@ -203,6 +794,10 @@ class Data(SharedGObject):
             're': re.compile('^#[ \t]*Name: ?(.*)$', re.I),
             'type': types.StringType
         },
+        'dtype': {
+            're': re.compile('^#[ \t]*Dtype: ?(.*)$', re.I),
+            'type': types.StringType
+        },
         'type': {
             're': re.compile('^#[ \t]*Type?: ?(.*)$', re.I),
             'type': types.StringType,
@@ -214,6 +809,17 @@ class Data(SharedGObject):
     _META_COLRE = re.compile('^#.*Column ?(\d+)', re.I)
     _META_COMMENTRE = re.compile('^#(.*)', re.I)
 
+    _BACKENDS = ('text', 'binary', 'hdf5')
+
+    # First bytes of a binary data file, followed by the header size,
+    # the number of columns and the dtype of the rows.
+    _BINARY_MAGIC = 'QTLBIN1 '
+    _BINARY_ALIGN = 8
+
+    # Formats that can be applied to a whole block of numbers at once
+    _BULK_FORMATRE = re.compile('^[^%]*%[-+ #0]*\d*(\.\d+)?[diouxXeEfFgG][^%]*$')
+    _BULK_CHUNK = 4096
+
     _INT_TYPES = (
             types.IntType, types.LongType,
             numpy.int, numpy.int0, numpy.int8,
@@ -245,6 +851,41 @@ class Data(SharedGObject):
             tempfile (bool), default False. If True create a temporary file
                 for the data.
             binary (bool), default True. Whether tempfile should be binary.
+            flush_rows (int), flush_bytes (int), flush_interval (float):
+                flush policy of the data file, see set_flush_policy().
+                Defaults are 'data_flush_rows', 'data_flush_bytes' and
+                'data_flush_interval' from config.
+            compress (string), how to create the gzipped copy of the data
+                file, see set_compress(). Default is 'data_compress' from
+                config, or 'stream' if not defined.
+            cache (bool), whether to use a binary cache when loading a
+                file, see lib/file_support/datacache.py. Default is
+                'data_cache' from config, or False if not defined. Cache
+                files are put next to the data file, or in 'data_cachedir'
+                from config if defined.
+            backend (string), format of the data file: 'text' (default),
+                'binary' or 'hdf5'. Default is 'data_backend' from config.
+                See create_file() for the binary format and
+                lib/file_support/datahdf5.py for the hdf5 format, which
+                requires h5py.
+            follow (bool), whether the data file is still being written by
+                another process. Only complete lines are loaded, and
+                refresh() parses the lines added since. Default False.
+            grid (bool), whether to store the data in memory in a
+                preallocated grid, see get_grid(). This requires the size of
+                all coordinates. Default is 'data_grid' from config, or
+                False if not defined.
+            pyramid (bool), whether to build a multi-resolution pyramid of
+                grid-shaped data while it is written, see get_level().
+                Default is 'data_pyramid' from config, or False if not
+                defined.
+            async_write (bool), whether to write the data file from a
+                background thread, so that a slow disk does not delay the
+                measurement. Default is 'data_async_write' from config, or
+                False if not defined. See get_io_stats().
+            async_queue (int), maximum number of flushed chunks waiting to
+                be written before add_data_point() blocks. Default is
+                'data_async_queue' from config, or 64.
         '''
 
         # Init SharedGObject a bit lower
@@ -259,12 +900,53 @@ class Data(SharedGObject):
         self._options = kwargs
         self._file = None
         self._stop_req_hid = None
+        self._store = _ArrayStore()
+        self._stats = _ColumnStats()
+        self._stats_valid = True
+        self._spillfiles = []
+        self._writer = None
+        self._column_formats = None
+        self._text_export = None
+        self._flush_policy = {
+            'rows': kwargs.get('flush_rows',
+                config.get('data_flush_rows', 100)),
+            'nbytes': kwargs.get('flush_bytes',
+                config.get('data_flush_bytes', 65536)),
+            'interval': kwargs.get('flush_interval',
+                config.get('data_flush_interval', 1.0)),
+        }
+        self.set_compress(kwargs.get('compress',
+            config.get('data_compress', 'stream')))
+        self._cache = kwargs.get('cache', config.get('data_cache', False))
+        self._grid = kwargs.get('grid', config.get('data_grid', False))
+        self._follow = kwargs.get('follow', False)
+        self._follow_offset = None
+        self._follow_state = None
+        self._async_write = kwargs.get('async_write',
+                config.get('data_async_write', False))
+        self._async_queue = kwargs.get('async_queue',
+                config.get('data_async_queue', 64))
+        self._io_stats = None
+        self._index = None
+        self._pyramid = None
+        self._build_pyramid = kwargs.get('pyramid',
+                config.get('data_pyramid', False))
+        self._backend = kwargs.get('backend',
+                config.get('data_backend', 'text'))
+        if self._backend not in self._BACKENDS:
+            raise ValueError('Unknown data backend %r' % (self._backend, ))
+        if self._backend == 'hdf5' and not datahdf5.is_available():
+            raise ValueError('The hdf5 backend requires h5py')
+        self._binary_dtype = numpy.dtype(numpy.float64)
+        self._binary_header_size = 0
+        self._blockfile = None
 
         # Dimension info
         self._dimensions = []
         self._block_sizes = []
         self._loopdims = None
         self._loopshape = None
+        self._loopsnake = None
         self._complete = False
         self._reshaped_data = None
 
@@ -301,6 +983,9 @@ class Data(SharedGObject):
             self._data = numpy.array([])
             self._infile = infile
 
+            # No data yet, so the statistics are up to date
+            self._stats_valid = True
+
         filepath = get_arg_type(args, kwargs, types.StringType, 'filepath')
         if self._tempfile:
             self.create_tempfile(filepath)
@@ -317,6 +1002,8 @@ class Data(SharedGObject):
         # Don't hold references to temporary data files
         if not self._tempfile:
             Data._data_list.add(name, self)
+            _memory.register(self)
+            _memory.check()
 
     def __repr__(self):
         ret = "Data '%s', filename '%s'" % (self._name, self._filename)
@@ -328,6 +1015,25 @@ class Data(SharedGObject):
     def __setitem__(self, index, val):
         self._data[index] = val
 
+    def _get_data_array(self):
+        _memory.touch(self)
+        return self._store.get_view()
+
+    def _set_data_array(self, data):
+        if not isinstance(self._store, _ArrayStore):
+            self._store = _ArrayStore()
+        self._store.set(data)
+        if len(self._spillfiles) > 0:
+            _memory.remove_spillfiles(self._spillfiles)
+            self._spillfiles = []
+
+        # Statistics are determined again when requested
+        self._stats.reset()
+        self._stats_valid = False
+
+    # The in-memory data, a view of the filled region of the store
+    _data = property(_get_data_array, _set_data_array)
+
 ### Data info
 
     def get_dimensions(self):
@@ -374,7 +1080,14 @@ class Data(SharedGObject):
         return self._nvalues
 
     def get_npoints(self):
-        '''Return number of data points'''
+        '''
+        Return number of data points. In grid mode this is the number of
+        rows returned by get_data(), i.e. up to the highest filled grid
+        index, including unfilled points in between.
+        '''
+
+        if isinstance(self._store, _GridStore):
+            return len(self._store)
         return self._npoints
 
     def get_npoints_max_block(self):
@@ -439,9 +1152,14 @@ class Data(SharedGObject):
         Normally the data is just a 2D array, with a set of values on each
         'line'. However, if reshape is True, the data will be reshaped into
         the detected dimension sizes.
+
+        The array returned is a view of the in-memory data; points added
+        later will not show up in it.
         '''
 
         if not self._inmem and self._infile:
+            if self._file is not None:
+                self.flush()
             self._load_file()
 
         if self._inmem:
@@ -452,10 +1170,96 @@ class Data(SharedGObject):
         else:
             return None
 
+    def get_grid(self):
+        '''
+        Return the data in grid mode as an N-D array with one axis per
+        coordinate plus one for the columns. This is a view of the data,
+        points that are added later show up in it; points that have not
+        been measured yet are NaN.
+
+        Returns None if the data is not stored in a grid.
+        '''
+
+        if not isinstance(self._store, _GridStore):
+            return None
+        return self._store.get_grid()
+
+    def get_column(self, col):
+        '''
+        Return column col of the data as a 1D array. If the column declares
+        a dtype (see add_coordinate()) the array has that dtype, while
+        get_data() promotes all columns to a common dtype.
+        '''
+
+        if not self._inmem and self._infile:
+            self._load_file()
+        if not self._inmem:
+            return None
+
+        if isinstance(self._store, _ColumnStore):
+            return self._store.get_column(col)
+        return self._data[:, col]
+
+    def get_column_stats(self, col=None):
+        '''
+        Return statistics of the data columns, which are kept up to date
+        while points are added, so the data does not have to be scanned.
+
+        Input:
+            col (int): column to return statistics for, or None for all
+
+        Output:
+            A dictionary with count (number of non-NaN values), nan_count,
+            min, max, sum, sum_squares, mean, std, first and last, or a list
+            with such a dictionary per column.
+        '''
+
+        if not self._stats_valid:
+            self._stats.reset()
+            if self._inmem and self._npoints > 0:
+                try:
+                    self._stats.update(self._data)
+                except (TypeError, ValueError), e:
+                    logging.debug('Unable to determine statistics: %s', e)
+            self._stats_valid = True
+
+        try:
+            stats = self._stats.get()
+        except (TypeError, ValueError), e:
+            logging.debug('Unable to determine statistics: %s', e)
+            self._stats.reset()
+            stats = []
+        if col is None:
+            return stats
+        if col >= len(stats):
+            return None
+        return stats[col]
+
     def get_reshaped_data(self):
         ''''Return data reshaped with the proper dimensions.'''
         return self.get_data(reshape=True)
 
+    def get_loop_info(self):
+        '''
+        Return the detected loop structure of the data as a dictionary:
+            loopdims: the looped coordinate columns, innermost first
+            shape: the size of each loop
+            snake: for each loop whether it sweeps back and forth
+            complete: whether the last sweep was complete
+            npoints_missing: number of points missing to complete it
+        '''
+
+        if self._loopdims is None:
+            return None
+
+        return {
+            'loopdims': list(self._loopdims),
+            'shape': list(self._loopshape),
+            'snake': list(self._loopsnake),
+            'complete': self._complete,
+            'npoints_missing': int(numpy.prod(self._loopshape)) - self._npoints,
+        }
+
     def get_title(self, coorddims, valdim):
         '''
         Return a title that can be used in a plot, containing the filename
@@ -501,6 +1305,22 @@ class Data(SharedGObject):
     def get_time_name(self):
         return '%s_%s' % (self._timemark, self._name)
 
+    def get_backend(self):
+        '''Return the data file format, 'text', 'binary' or 'hdf5'.'''
+        return self._backend
+
+    def get_binary_header_size(self):
+        '''Return the size in bytes of the header of a binary data file.'''
+        return self._binary_header_size
+
+    def get_binary_dtype(self):
+        '''Return the numpy dtype string of rows in a binary data file.'''
+        return self._binary_dtype.str
+
+    def get_block_index_filepath(self):
+        '''Return path of the block and comment index of a binary file.'''
+        return self.get_filepath() + '.blocks'
+
     def get_settings_filepath(self):
         fn, ext = os.path.splitext(self.get_filepath())
         return fn + '.set'
@@ -513,6 +1333,81 @@ class Data(SharedGObject):
         else:
             return False
 
+    def set_flush_policy(self, rows=None, nbytes=None, interval=None):
+        '''
+        Set when data written to file is flushed to disk. Data is flushed
+        when the number of buffered rows or bytes, or the time in seconds
+        since the last flush, reaches the given limit. A limit of None
+        disables that check, 0 flushes after every data point.
+
+        Data is always flushed at the end of a block and when closing the
+        file.
+        '''
+
+        self._flush_policy = {
+            'rows': rows,
+            'nbytes': nbytes,
+            'interval': interval,
+        }
+        if self._writer is not None:
+            self._writer.set_policy(**self._flush_policy)
+
+    def get_flush_policy(self):
+        '''Return the flush policy, see set_flush_policy().'''
+        return self._flush_policy
+
+    def set_compress(self, mode):
+        '''
+        Set how the gzipped copy (<filepath>.gz) of the data file is made.
+        This should be set before calling create_file().
+
+        Input:
+            mode (string):
+                'stream': compress in a background thread while the data
+                    is being written, the .gz is complete when close_file()
+                    returns.
+                'close': compress the finished file in close_file().
+                None / False: do not create a compressed copy, e.g. for
+                    files that will be synced anyway.
+        '''
+
+        if mode is True:
+            mode = 'stream'
+        elif not mode:
+            mode = None
+        if mode not in ('stream', 'close', None):
+            raise ValueError('Unknown compression mode %r' % (mode, ))
+        self._compress = mode
+
+    def get_compress(self):
+        '''Return the compression mode, see set_compress().'''
+        return self._compress
+
+    def flush(self, wait=True):
+        '''
+        Write buffered data to the data file. When writing asynchronously,
+        wait until it is on disk if 'wait' is True.
+        '''
+
+        if self._writer is None:
+            return
+        if wait:
+            self._writer.sync()
+        else:
+            self._writer.flush()
+
+    def get_io_stats(self):
+        '''
+        Return statistics of the asynchronous writer thread, such as the
+        queue depth and the lag of the writer, see
+        lib/file_support/datawriter.py. After closing the file the final
+        statistics are returned. Returns None if not writing asynchronously.
+        '''
+
+        if self._writer is not None and self._writer.get_thread() is not None:
+            return self._writer.get_thread().get_stats()
+        return self._io_stats
+
 ### Measurement info
 
     def add_coordinate(self, name, **kwargs):
@@ -529,14 +1424,20 @@ class Data(SharedGObject):
                 precision (int): precision of stored data, default is
                     'default_precision' from config, or 12 if not defined.
                 format (string): format of stored data, not used by default
+                dtype (string or numpy dtype): type used to store this
+                    column in memory, e.g. 'int32' or 'uint16'. Default is
+                    float64.
         '''
 
         kwargs['name'] = name
         kwargs['type'] = 'coordinate'
+        if 'dtype' in kwargs:
+            kwargs['dtype'] = numpy.dtype(kwargs['dtype']).name
         if 'size' not in kwargs:
             kwargs['size'] = 0
         self._ncoordinates += 1
         self._dimensions.append(kwargs)
+        self._column_formats = None
 
     def add_value(self, name, **kwargs):
         '''
@@ -552,17 +1453,28 @@ class Data(SharedGObject):
                 precision (int): precision of stored data, default is
                     'default_precision' from config, or 12 if not defined.
                 format (string): format of stored data, not used by default
+                dtype (string or numpy dtype): type used to store this
+                    column in memory, see add_coordinate().
         '''
         kwargs['name'] = name
+        if 'dtype' in kwargs:
+            kwargs['dtype'] = numpy.dtype(kwargs['dtype']).name
         kwargs['type'] = 'value'
         self._nvalues += 1
         self._dimensions.append(kwargs)
+        self._column_formats = None
 
     def add_comment(self, comment):
         '''Add comment to the Data object.'''
         self._comment.append(comment)
         if self._file is not None:
-            self._file.write('# %s\n' % comment)
+            if self._backend == 'binary':
+                self._blockfile.write('comment %s\n' % comment)
+                self._blockfile.flush()
+            elif self._backend == 'hdf5':
+                self._writer.add_comment(comment)
+            else:
+                self._write('# %s\n' % comment)
 
     def get_comment(self):
         '''Return the comment for the Data object.'''
@@ -579,6 +1491,18 @@ class Data(SharedGObject):
 
         This function should be called after adding the comment and the
         coordinate and value metadata, because it writes the file header.
+
+        For the 'binary' backend the file (with extension .bin if the name
+        is generated) starts with a line containing _BINARY_MAGIC, the
+        header size in bytes, the number of columns and the dtype of the
+        rows. It is followed by the same header as a text file, padded to
+        a multiple of 8 bytes, after which the rows are appended as raw
+        data. Block ends and comments added later are listed in a separate
+        text file, <filepath>.blocks.
+
+        For the 'hdf5' backend (extension .hdf5) see
+        lib/file_support/datahdf5.py. The file also contains a snapshot of
+        the instrument settings, and can be read while it is written.
         '''
 
         if name is None and filepath is None:
@@ -586,18 +1510,48 @@ class Data(SharedGObject):
 
         if filepath is None:
             filepath = self._filename_generator.new_filename(self, user)
+            if self._backend == 'binary':
+                filepath = os.path.splitext(filepath)[0] + '.bin'
+            elif self._backend == 'hdf5':
+                filepath = os.path.splitext(filepath)[0] + '.hdf5'
 
         self._dir, self._filename = os.path.split(filepath)
         if not os.path.isdir(self._dir):
             os.makedirs(self._dir)
 
+        if self._backend == 'hdf5':
+            return self._create_hdf5_file(settings_file)
+
         try:
-            self._file = open(self.get_filepath(), 'w+')
+            if self._backend == 'binary':
+                self._file = open(self.get_filepath(), 'wb')
+                self._blockfile = open(self.get_block_index_filepath(), 'w')
+            else:
+                self._file = open(self.get_filepath(), 'w+')
         except:
             logging.error('Unable to open file')
             return False
 
-        self._write_header()
+        self._open_writer(compress=True)
+        if self._backend == 'binary':
+            self._index = None
+            self._write_binary_header()
+        else:
+            self._index = BlockIndex(self.get_filepath(),
+                    config.get('data_index_rowstep', 1024))
+            try:
+                self._index.create()
+            except IOError, e:
+                logging.warning('Unable to create block index: %s', e)
+                self._index = None
+            self._write_header()
+            if self._index is not None:
+                self._index.add_block(0, self._writer.get_position())
+        self.flush()
+
+        self._pyramid = None
+        if self._build_pyramid and not self._tempfile:
+            self._pyramid = self._create_pyramid()
 
         if settings_file and in_qtlab:
             self._write_settings_file()
@@ -617,62 +1571,194 @@ class Data(SharedGObject):
         '''
 
         if self._file is not None:
+            thread = self._writer.get_thread()
+            self._writer.close()
+            if thread is not None:
+                self._io_stats = thread.get_stats()
+            self._writer = None
             self._file.close()
-            with open(self.get_filepath(),'rb') as file:
-                with gzip.open(self.get_filepath()+'.gz', 'wb') as gzfile:
-                    gzfile.writelines(file)
+            if self._blockfile is not None:
+                self._blockfile.close()
+                self._blockfile = None
+            if self._index is not None:
+                self._index.close()
+            if self._pyramid is not None:
+                self._pyramid.close()
+            if self._compress == 'close' and self._backend != 'hdf5':
+                with open(self.get_filepath(),'rb') as file:
+                    with gzip.open(self.get_filepath()+'.gz', 'wb') as gzfile:
+                        gzfile.writelines(file)
             #os.remove(self.get_filepath())
             self._file = None
+            _memory.check()
 
         if self._stop_req_hid is not None and in_qtlab:
             qt.flow.disconnect(self._stop_req_hid)
             self._stop_req_hid = None
 
-    def _write_settings_file(self):
+    def _create_hdf5_file(self, settings_file):
+        '''Create the data file for the 'hdf5' backend.'''
+
+        settings = []
+        if settings_file and in_qtlab:
+            settings = self._get_settings()
+
+        try:
+            self._writer = datahdf5.HDF5Writer(self.get_filepath(),
+                    len(self._dimensions), header=self._format_header(),
+                    names=[dim.get('name', '') for dim in self._dimensions],
+                    types=[dim.get('type', '') for dim in self._dimensions],
+                    settings=settings,
+                    compresslevel=config.get('data_hdf5_compress_level', 4),
+                    **self._flush_policy)
+        except Exception, e:
+            logging.error('Unable to open file: %s', e)
+            return False
+        self._file = self._writer.get_file()
+        self._index = None
+
+        self._pyramid = None
+        if self._build_pyramid:
+            self._pyramid = self._create_pyramid()
+
+        if settings_file and in_qtlab:
+            self._write_settings_file(settings)
+
+        try:
+            if in_qtlab:
+                self._stop_req_hid = \
+                    qt.flow.connect('stop-request', self._stop_request_cb)
+        except:
+            pass
+
+        return True
+
+    def _get_settings(self):
+        '''
+        Return the current instrument settings as a sorted list of
+        (instrument name, [(parameter, value), ...]) tuples.
+        '''
+
+        ret = []
+        inslist = dict_to_ordered_tuples(qt.instruments.get_instruments())
+        for (iname, ins) in inslist:
+            parlist = dict_to_ordered_tuples(ins.get_parameters())
+            ret.append((iname, [(param, ins.get(param, query=False)) \
+                    for (param, popts) in parlist]))
+        return ret
+
+    def _write_settings_file(self, settings=None):
+        if settings is None:
+            settings = self._get_settings()
+
         fn = self.get_settings_filepath()
         f = open(fn, 'w+')
         f.write('Filename: %s\n' % self._filename)
         f.write('Timestamp: %s\n\n' % self._timestamp)
 
-        inslist = dict_to_ordered_tuples(qt.instruments.get_instruments())
-        for (iname, ins) in inslist:
+        for (iname, params) in settings:
             f.write('Instrument: %s\n' % iname)
-            parlist = dict_to_ordered_tuples(ins.get_parameters())
-            for (param, popts) in parlist:
-                f.write('\t%s: %s\n' % (param, ins.get(param, query=False)))
+            for (param, val) in params:
+                f.write('\t%s: %s\n' % (param, val))
 
         f.close()
 
-    def _write_header(self):
-        self._file.write('# Filename: %s\n' % self._filename)
-        self._file.write('# Timestamp: %s\n\n' % self._timestamp)
+    def _open_writer(self, compress=False):
+        if compress and self._compress == 'stream':
+            compressor = StreamCompressor(self.get_filepath() + '.gz',
+                    config.get('data_compress_level', 6))
+        else:
+            compressor = None
+
+        # Only the data file itself is written asynchronously
+        if compress and self._async_write:
+            thread = FileWriterThread(self._file, self._async_queue,
+                    compressor=compressor)
+            compressor = None
+        else:
+            thread = None
+
+        self._writer = BufferedWriter(self._file, compressor=compressor,
+                thread=thread, **self._flush_policy)
+        self._column_formats = None
+
+    def _write(self, text, nrows=0):
+        '''Write text containing nrows data rows through the buffer.'''
+        self._writer.write(text, nrows)
+
+    def _format_header(self):
+        lines = []
+        lines.append('# Filename: %s\n' % self._filename)
+        lines.append('# Timestamp: %s\n\n' % self._timestamp)
         for line in self._comment:
-            self._file.write('# %s\n' % line)
+            lines.append('# %s\n' % line)
 
         i = 1
         for dim in self._dimensions:
-            self._file.write('# Column %d:\n' % i)
+            lines.append('# Column %d:\n' % i)
             for key, val in dict_to_ordered_tuples(dim):
-                self._file.write('#\t%s: %s\n' % (key, val))
+                lines.append('#\t%s: %s\n' % (key, val))
             i += 1
 
-        self._file.write('\n')
+        lines.append('\n')
+        return ''.join(lines)
+
+    def _write_header(self):
+        self._write(self._format_header())
+
+    def _write_binary_header(self):
+        header = self._format_header()
+        firstlen = len(self._BINARY_MAGIC) + 11 + 5 + \
+                len(self._binary_dtype.str) + 1
+        size = firstlen + len(header)
+        size += -size % self._BINARY_ALIGN
+
+        first = '%s%010d %04d %s\n' % (self._BINARY_MAGIC, size,
+                len(self._dimensions), self._binary_dtype.str)
+        header = header[:-1] + ' ' * (size - firstlen - len(header)) + '\n'
+
+        self._binary_header_size = size
+        self._write(first + header)
+
+    def _write_binary_rows(self, rows):
+        '''Write a 2D array of rows to a binary data file.'''
+
+        if self._file is None:
+            logging.info('File not opened yet, doing now')
+            self.create_file()
+
+        rows = numpy.asarray(rows, dtype=self._binary_dtype)
+        self._write(rows.tostring(), len(rows))
+
+    def _get_column_format(self, colnum):
+        '''
+        Return the format string for non-integer values in column colnum.
+        The formats are determined once from the dimension info.
+        '''
+
+        if self._column_formats is None:
+            formats = []
+            for opts in self._dimensions:
+                if 'format' in opts:
+                    formats.append(opts['format'])
+                elif 'precision' in opts:
+                    formats.append('%%.%de' % opts['precision'])
+                else:
+                    formats.append(None)
+            self._column_formats = formats
+
+        if colnum < len(self._column_formats) and \
+                self._column_formats[colnum] is not None:
+            return self._column_formats[colnum]
+
+        precision = config.get('default_precision', 12)
+        return '%%.%de' % precision
 
     def _format_data_value(self, val, colnum):
         if type(val) in self._INT_TYPES:
             return '%d' % val
 
-        if colnum < len(self._dimensions):
-            opts = self._dimensions[colnum]
-            if 'format' in opts:
-                return opts['format'] % val
-            elif 'precision' in opts:
-                format = '%%.%de' % opts['precision']
-                return format % val
-
-        precision = config.get('default_precision', 12)
-        format = '%%.%de' % precision
-        return format % val
+        return self._get_column_format(colnum) % val
 
     def _write_data_line(self, args):
         '''
@@ -697,8 +1783,82 @@ class Data(SharedGObject):
             logging.info('File not opened yet, doing now')
             self.create_file()
 
-        self._file.write(line)
-        self._file.flush()
+        self._write(line, 1)
+
+    def _get_bulk_row_format(self, columns):
+        '''
+        Return the format for a complete data line of the given columns,
+        or None if the columns can not be formatted in one pass. Integer
+        columns are formatted with '%d', as _format_data_value() does for
+        each integer value.
+        '''
+
+        formats = []
+        for colnum, col in enumerate(columns):
+            if isinstance(col, numpy.ndarray):
+                if col.dtype.kind not in 'biuf':
+                    return None
+                coltype = col.dtype.type
+            else:
+                coltypes = set(map(type, col))
+                if len(coltypes) != 1:
+                    return None
+                coltype = coltypes.pop()
+                if not issubclass(coltype, (int, long, float,
+                        numpy.number, numpy.bool_)):
+                    return None
+
+            if coltype in self._INT_TYPES:
+                formats.append('%d')
+            else:
+                format = self._get_column_format(colnum)
+                if self._BULK_FORMATRE.match(format) is None:
+                    return None
+                formats.append(format)
+
+        return '\t'.join(formats) + '\n'
+
+    def _write_data_lines(self, rows, columns=None):
+        '''
+        Write several lines of data. 'rows' is a sequence of data points,
+        'columns' can optionally contain the same data as a list of columns.
+
+        The line format is determined once and the data is formatted in
+        chunks of lines. The output is identical to calling
+        _write_data_line() for each row; data that can not be handled
+        this way is written line by line.
+        '''
+
+        if columns is None:
+            if isinstance(rows, numpy.ndarray):
+                if rows.ndim == 1:
+                    columns = [rows]
+                else:
+                    columns = list(rows.T)
+            elif numpy.ndim(rows) == 1:
+                columns = [rows]
+            else:
+                columns = zip(*rows)
+
+        rowfmt = self._get_bulk_row_format(columns)
+        if rowfmt is None:
+            for row in rows:
+                self._write_data_line(row)
+            return
+
+        if self._file is None:
+            logging.info('File not opened yet, doing now')
+            self.create_file()
+
+        ncols = len(columns)
+        values = [numpy.asarray(col).tolist() for col in columns]
+        values = list(itertools.chain.from_iterable(itertools.izip(*values)))
+        nrows = len(values) / ncols
+        for start in xrange(0, nrows, self._BULK_CHUNK):
+            stop = min(nrows, start + self._BULK_CHUNK)
+            text = (rowfmt * (stop - start)) % \
+                    tuple(values[start * ncols:stop * ncols])
+            self._write(text, stop - start)
 
     def _get_block_columns(self):
         blockcols = []
@@ -717,18 +1877,46 @@ class Data(SharedGObject):
             logging.warning('Unable to _write_data() without having it memory')
             return False
 
-        blockcols = self._get_block_columns()
+        if self._backend == 'binary' and not self._tempfile:
+            start = 0
+            for end in self._get_block_ends():
+                self._write_binary_rows(self._data[start:end])
+                self.flush(wait=False)
+                self._blockfile.write('block %d\n' % end)
+                start = end
+            self._write_binary_rows(self._data[start:])
+            self.flush()
+            return
 
-        lastvals = None
+        if self._backend == 'hdf5' and not self._tempfile:
+            start = 0
+            for end in self._get_block_ends():
+                self._writer.write_rows(self._data[start:end])
+                self._writer.add_block(end)
+                start = end
+            self._writer.write_rows(self._data[start:])
+            self.flush()
+            return
+
+        blockcols = self._get_block_columns()
+
+        lastvals = None
         for vals in self._data:
             if type(vals) is numpy.ndarray and lastvals is not None:
                 for i in range(len(vals)):
                     if blockcols[i] and vals[i] != lastvals[i]:
-                        self._file.write('\n')
+                        self._write('\n')
 
             self._write_data_line(vals)
             lastvals = vals
 
+        self.flush()
+
+    def _get_block_ends(self):
+        '''Return the row indices at which a new block starts.'''
+        ends = numpy.unique(numpy.cumsum(self._block_sizes, dtype=numpy.int64))
+        return [int(e) for e in ends if 0 < e < self._npoints]
+
     def _write_binary(self):
         if not self._inmem:
             logging.warning('Unable to _write_binary() without having it memory')
@@ -739,6 +1927,102 @@ class Data(SharedGObject):
 
 ### High-level file writing
 
+    def export_text(self, filepath=None):
+        '''
+        Write the data to a text data file, e.g. to export a binary data
+        file. If filepath is None, the data file path with extension .dat
+        is used.
+
+        Output:
+            The path of the text file, or None on failure.
+        '''
+
+        data = self._get_export_rows(0)
+        if data is None:
+            logging.warning('No data available to export')
+            return None
+
+        if filepath is None:
+            filepath = os.path.splitext(self.get_filepath())[0] + '.dat'
+
+        ends = self._get_block_ends()
+        self._write_export(filepath, 'w', data, 0, ends)
+        self._text_export = (filepath, len(data), len(ends))
+        return filepath
+
+    def update_text_export(self, filepath):
+        '''
+        Keep a text export of the data up to date, e.g. for plotting data
+        of the 'hdf5' backend while it is measured. The first call writes
+        the file like export_text(), later calls with the same filepath
+        only append the rows added since.
+
+        Output:
+            The path of the text file, or None on failure.
+        '''
+
+        state = self._text_export
+        if state is None or state[0] != filepath or \
+                state[1] > self._npoints or not os.path.exists(filepath):
+            return self.export_text(filepath)
+
+        start, nends = state[1:]
+        if self._npoints == start:
+            return filepath
+
+        rows = self._get_export_rows(start)
+        if rows is None:
+            return None
+        ends = self._get_block_ends()
+        self._write_export(filepath, 'a', rows, start, ends[nends:])
+        self._text_export = (filepath, start + len(rows), len(ends))
+        return filepath
+
+    def _get_export_rows(self, start):
+        '''
+        Return the rows from row 'start' on without reloading the file of
+        a Data object that is being written.
+        '''
+
+        if self._backend == 'hdf5' and self._writer is not None:
+            self._writer.flush()
+            return self._writer.get_file()['data'][start:]
+        if self._inmem and self._npoints > 0:
+            return self._data[start:]
+
+        data = self.get_data()
+        if data is None:
+            return None
+        return data[start:]
+
+    def _write_export(self, filepath, mode, rows, start, ends):
+        '''
+        Write rows, the first being row 'start', to a text file, with a
+        block separator before each row number in 'ends'. The header is
+        written if mode is 'w'.
+        '''
+
+        saved = (self._file, self._writer, self._filename)
+        try:
+            self._file = open(filepath, mode)
+            self._filename = os.path.basename(filepath)
+            self._open_writer()
+            if mode == 'w':
+                self._write_header()
+
+            pos = start
+            for end in ends:
+                self._write_data_lines(rows[pos - start:end - start])
+                self._write('\n')
+                pos = end
+            self._write_data_lines(rows[pos - start:])
+
+            self._writer.close()
+            self._file.close()
+        finally:
+            self._file, self._writer, self._filename = saved
+            self._column_formats = None
+
     def write_file(self, name=None, filepath=None):
         '''
         Create and write a new data file.
@@ -760,6 +2044,7 @@ class Data(SharedGObject):
         else:
             mode = 'w'
         self._file = temp.File(path, mode=mode, binary=self._temp_binary)
+        self._open_writer()
         try:
             if self._temp_binary:
                 ret = self._write_binary()
@@ -785,6 +2070,7 @@ class Data(SharedGObject):
             return
 
         self._file.reopen()
+        self._open_writer()
         if self._temp_binary:
             self._write_binary()
         else:
@@ -826,12 +2112,17 @@ class Data(SharedGObject):
                 n column values or a 2d array
             **kwargs:
                 newblock (boolean): marks a new 'block' starts after this point
+                index (tuple): in grid mode, store a single point at this
+                    grid index (one entry per coordinate) instead of after
+                    the last point. Points with and without an index can
+                    not be mixed.
 
         Output:
             None
         '''
 
         # Check what type of data is being added
+        columns = None
         shapes = [numpy.shape(i) for i in args]
         dims = numpy.array([len(i) for i in shapes])
 
@@ -864,6 +2155,7 @@ class Data(SharedGObject):
                 ncols = len(args)
                 npoints = shapes[0][0]
                 # Transpose args to a single 2-d list
+                columns = args
                 args = zip(*args)
             elif sum(dims!=0) == 0:
                 ncols = len(args)
@@ -892,18 +2184,46 @@ class Data(SharedGObject):
         # At this point 'args' is either:
         #   - a 1d tuple of numbers, for adding a single data point
         #   - a 2d tuple/list/array, for adding >1 data points
+        rows = numpy.reshape(args, (npoints, ncols))
+
         if self._inmem:
-            if len(self._data) == 0:
-                self._data = numpy.atleast_2d(args)
+            capacity = self._store.get_capacity()
+            if self._npoints == 0:
+                if self._grid:
+                    self._create_grid(ncols)
+                elif self._get_column_dtypes() is not None:
+                    self._store = _ColumnStore(self._get_column_dtypes())
+            if isinstance(self._store, _GridStore):
+                if not self._add_grid_rows(rows, kwargs.get('index', None)):
+                    return
             else:
-                self._data = numpy.append(self._data, [args], axis=0)
+                self._store.append(rows)
+            if self._store.get_capacity() != capacity:
+                _memory.check()
+
+        if self._stats_valid:
+            try:
+                self._stats.update(rows)
+            except (TypeError, ValueError):
+                self._stats_valid = False
+
+        if self._pyramid is not None:
+            self._pyramid.add_rows(rows)
 
         if self._infile:
-            if npoints == 1:
+            if self._index is not None and not self._tempfile and \
+                    (self._npoints + npoints) / self._index.get_rowstep() > \
+                    self._npoints / self._index.get_rowstep():
+                self._index.add_row(self._npoints, self._writer.get_position())
+
+            if self._backend == 'binary':
+                self._write_binary_rows(rows)
+            elif self._backend == 'hdf5':
+                self._writer.write_rows(rows)
+            elif npoints == 1:
                 self._write_data_line(args)
             elif npoints > 1:
-                for i in range(npoints):
-                    self._write_data_line(args[i])
+                self._write_data_lines(args, columns)
 
         self._npoints += npoints
         self._npoints_last_block += npoints
@@ -915,11 +2235,77 @@ class Data(SharedGObject):
         else:
             self.emit('new-data-point')
 
+    def _get_column_dtypes(self):
+        '''
+        Return the dtypes of the columns, or None if no column declares a
+        dtype.
+        '''
+
+        dtypes = [dim.get('dtype', None) for dim in self._dimensions]
+        if dtypes.count(None) == len(dtypes):
+            return None
+        return [dt or 'float64' for dt in dtypes]
+
+    def _create_grid(self, ncols):
+        sizes = [int(round(dim.get('size', 0))) \
+                for dim in self._dimensions if dim['type'] == 'coordinate']
+        if len(sizes) == 0 or min(sizes) <= 0:
+            logging.warning('Grid mode requires the size of all coordinates, not using a grid')
+            self._grid = False
+            return
+
+        self._store = _GridStore(sizes, ncols)
+        self._loopdims = range(len(sizes))
+        self._loopshape = sizes
+        self._loopsnake = [False] * len(sizes)
+        self._reshaped_data = None
+
+    def _add_grid_rows(self, rows, index):
+        '''
+        Add rows to the grid, returns False if they can not be added.
+        When the grid is full it is replaced by a normal store.
+        '''
+
+        try:
+            if index is not None and len(rows) == 1:
+                self._store.put(index, rows[0])
+            else:
+                self._store.append(rows)
+        except ValueError, e:
+            logging.warning('Unable to add point to grid: %s', e)
+            return False
+        except IndexError, e:
+            logging.warning('Unable to add point to grid (%s), no longer using a grid', e)
+            self._store = _ArrayStore(self._store.get_view())
+            self._store.append(rows)
+            self._grid = False
+        return True
+
     def new_block(self):
         '''Start a new data block.'''
 
         if self._infile:
-            self._file.write('\n')
+            if self._backend == 'binary':
+                self.flush(wait=False)
+                self._blockfile.write('block %d\n' % self._npoints)
+                self._blockfile.flush()
+            elif self._backend == 'hdf5':
+                self._writer.add_block(self._npoints)
+            else:
+                self._write('\n')
+                if self._index is not None:
+                    # The index entries are written once the data they
+                    # point at is in the file, without waiting for that.
+                    self._index.add_block(self._npoints,
+                            self._writer.get_position())
+                    nentries = self._index.get_nentries()
+                    index = self._index
+                    self._writer.call(lambda: index.flush(nentries))
+                else:
+                    self.flush(wait=False)
+
+        if self._pyramid is not None:
+            self._pyramid.end_row()
 
         self._block_sizes.append(self._npoints_last_block)
         self._npoints_last_block = 0
@@ -1008,6 +2394,269 @@ class Data(SharedGObject):
 
 ### File reading
 
+    def _get_block_index(self):
+        '''
+        Return the block index of the data file, loading it from its
+        sidecar or building it if necessary.
+        '''
+
+        if self._index is not None:
+            # The index of a file being written is always up to date
+            if self._file is None:
+                self._index.update()
+            return self._index
+
+        index = BlockIndex(self.get_filepath(),
+                config.get('data_index_rowstep', 1024))
+        if index.load():
+            index.update()
+        else:
+            index.update()
+            index.save()
+        self._index = index
+        return index
+
+    def _create_pyramid(self):
+        '''Return a new Pyramid for the data file.'''
+
+        sizes = [int(round(dim.get('size', 0))) \
+                for dim in self._dimensions if dim['type'] == 'coordinate']
+        shape = None
+        if len(sizes) >= 2 and min(sizes[:2]) > 0:
+            shape = sizes[:2]
+        elif len(sizes) >= 1 and sizes[0] > 0:
+            shape = sizes[:1]
+        return Pyramid(self.get_filepath(), shape=shape,
+                factor=config.get('data_pyramid_factor', 2),
+                minsize=config.get('data_pyramid_minsize', 16))
+
+    def build_pyramid(self):
+        '''
+        Build the multi-resolution pyramid of a data file that was written
+        without one, see get_level().
+        '''
+
+        if self._file is not None:
+            logging.warning('Cannot build a pyramid while writing the file')
+            return False
+
+        pyramid = self._create_pyramid()
+        try:
+            for info, rows in self.iter_blocks():
+                pyramid.add_rows(rows)
+                pyramid.end_row()
+        finally:
+            pyramid.close()
+        self._pyramid = pyramid
+        return True
+
+    def get_nlevels(self):
+        '''
+        Return the number of levels of the pyramid, including the full
+        resolution level 0.
+        '''
+
+        pyramid = self._get_pyramid()
+        if pyramid is None:
+            return 1
+        return pyramid.get_nlevels()
+
+    def get_level(self, level, region=None):
+        '''
+        Return grid-shaped data at a reduced resolution, for viewers that
+        do not need all points of a large map.
+
+        Level L combines every F**L x F**L points into one cell, with F the
+        factor 'data_pyramid_factor' from config (default 2). The pyramid
+        is built while the data is written if the Data object was created
+        with pyramid=True, or otherwise the first time a level is
+        requested. See lib/file_support/datapyramid.py.
+
+        Input:
+            level (int): the level, 0 for full resolution
+            region (tuple): (first block, last block, first point, last
+                point) in full resolution units, with python slice
+                semantics. Default is everything.
+
+        Output:
+            numpy.array with shape (rows, cells per row, 3, columns) with
+            the minimum, maximum and mean of every column per cell.
+        '''
+
+        if level == 0:
+            r0, r1, c0, c1 = region or (None, None, None, None)
+            rows = self.read_blocks(r0 or 0, r1)
+            if rows is None:
+                return None
+            ncells = self._npoints_max_block
+            if ncells == 0:
+                first = self.read_blocks(0, 1)
+                ncells = max(len(first), 1)
+            nrows = (len(rows) + ncells - 1) / ncells
+            grid = numpy.empty((nrows * ncells, rows.shape[1]))
+            grid.fill(numpy.nan)
+            grid[:len(rows)] = rows
+            grid = grid.reshape((nrows, ncells, 1, -1))[:, c0:c1]
+            return numpy.repeat(grid, 3, axis=2)
+
+        pyramid = self._get_pyramid()
+        if pyramid is None:
+            return None
+        return pyramid.get_level(level, region)
+
+    def _get_pyramid(self):
+        if self._pyramid is None:
+            pyramid = Pyramid(self.get_filepath())
+            if pyramid.load():
+                self._pyramid = pyramid
+            else:
+                self.build_pyramid()
+        return self._pyramid
+
+    def _read_rows_at(self, offset, endoffset):
+        '''Parse the rows between two byte offsets of the data file.'''
+
+        f = open(self.get_filepath(), 'rb')
+        try:
+            f.seek(offset)
+            if endoffset is None:
+                text = f.read()
+            else:
+                text = f.read(endoffset - offset)
+        finally:
+            f.close()
+
+        # A line that is still being written is left out
+        text = text[:text.rfind('\n') + 1]
+
+        ncols = self.get_ndimensions()
+        if ncols == 0:
+            ncols = None
+        state = {
+            'nfields': ncols,
+            'npoints': 0,
+            'ends': [],
+            'last_end': 0,
+            'meta': False,
+        }
+        values = self._parse_data_chunk(text.splitlines(True), state)
+        if values is None:
+            logging.warning('Unable to parse rows of %s', self.get_filepath())
+            return None
+        if state['nfields'] is None:
+            return numpy.zeros((0, self.get_ndimensions()))
+        return values.reshape((-1, state['nfields']))
+
+    def read_blocks(self, start=0, stop=None):
+        '''
+        Read blocks start up to stop from the data file, without loading
+        the rest of the file. Indices work as for a python slice, e.g.
+        read_blocks(-10) returns the last 10 blocks.
+
+        Text files use a block index, see lib/file_support/dataindex.py.
+
+        Output:
+            2D numpy.array with the rows of the blocks, or None on failure.
+        '''
+
+        if self._file is not None:
+            self.flush()
+
+        if self._backend in ('binary', 'hdf5'):
+            ret = self._read_backend_rows()
+            if ret is None:
+                return None
+            data, ends = ret
+            starts = [0] + ends + [len(data)]
+            start, stop = _clip_range(start, stop, len(starts) - 1)
+            if start >= stop:
+                return data[:0]
+            return data[starts[start]:starts[stop]]
+
+        if not os.path.exists(self.get_filepath()):
+            logging.warning('Data file %s does not exist', self.get_filepath())
+            return None
+
+        index = self._get_block_index()
+        nblocks = index.get_nblocks()
+        if self._file is not None:
+            nrows = self._npoints
+        else:
+            nrows = index.get_nrows()
+        # A new block without rows yet does not count
+        if nblocks > 0 and index.get_block(nblocks - 1)[0] >= nrows:
+            nblocks -= 1
+        start, stop = _clip_range(start, stop, nblocks)
+        if start >= stop:
+            return numpy.zeros((0, self.get_ndimensions()))
+
+        offset = index.get_block(start)[1]
+        if stop < nblocks:
+            endoffset = index.get_block(stop)[1]
+        else:
+            endoffset = None
+        return self._read_rows_at(offset, endoffset)
+
+    def read_rows(self, start, stop=None):
+        '''
+        Read rows start up to stop (or the end) from a text data file,
+        using the row offsets in the block index.
+
+        Output:
+            2D numpy.array, or None on failure.
+        '''
+
+        if self._file is not None:
+            self.flush()
+
+        if self._backend in ('binary', 'hdf5'):
+            ret = self._read_backend_rows()
+            if ret is None:
+                return None
+            return ret[0][start:stop]
+
+        index = self._get_block_index()
+        entry = index.get_row(start)
+        if entry is None:
+            return numpy.zeros((0, self.get_ndimensions()))
+
+        endoffset = None
+        if stop is not None:
+            after = index.get_row_after(stop)
+            if after is not None:
+                endoffset = after[1]
+
+        rows = self._read_rows_at(entry[1], endoffset)
+        if rows is None:
+            return None
+        first = start - entry[0]
+        if stop is None:
+            return rows[first:]
+        return rows[first:stop - entry[0]]
+
+    def _read_backend_rows(self):
+        '''
+        Return (data, block ends) of a binary or HDF5 data set, or None on
+        failure. Data that is not in memory is read from the file, also
+        while it is being written, without changing the state of this
+        object.
+        '''
+
+        if self._inmem:
+            return self._data, self._get_block_ends()
+
+        if self._backend == 'binary':
+            ret = self._map_binary_file(meta=False)
+            if ret is None:
+                return None
+            data, ends = ret
+        else:
+            info = self._read_hdf5_file(meta=False)
+            if info is None:
+                return None
+            data, ends = info['data'], info['ends']
+        return data, sorted(set([e for e in ends if 0 < e < len(data)]))
+
     def _count_coord_val_dims(self):
         self._ncoordinates = 0
         self._nvalues = 0
@@ -1020,29 +2669,400 @@ class Data(SharedGObject):
             self._nvalues = 1
             self._ncoordinates -= 1
 
+    # Number of bytes read per chunk when parsing the body of a data file
+    _LOAD_CHUNK = 1 << 22
+
     def _load_file(self):
         """
         Load data from file and store internally.
+
+        The '#' header is parsed first, after which the numeric body is
+        parsed in chunks with numpy. Files that can not be parsed that way,
+        e.g. because lines have a varying number of columns, are parsed
+        line by line.
         """
 
+        filepath = self.get_filepath()
+        if self._is_binary_file(filepath):
+            return self._load_binary_file()
+        if datahdf5.is_hdf5_file(filepath):
+            return self._load_hdf5_file()
+
+        cache = self._cache and not self._follow
+        if cache and self._load_cache():
+            return True
+
         try:
-            f = file(self.get_filepath(), 'r')
+            if self._follow:
+                f = file(filepath, 'rb')
+                end = _get_complete_size(f)
+                f.seek(0)
+            else:
+                f = file(filepath, 'r')
+            if cache:
+                key = datacache.get_file_key(filepath)
         except:
-            logging.warning('Unable to open file %s' % self.get_filepath())
+            logging.warning('Unable to open file %s' % filepath)
+            return False
+
+        self._follow_state = None
+        try:
+            if self._follow:
+                state = {}
+                ret = self._parse_file_fast(_FileRange(f, end), state)
+                if ret is not None:
+                    self._follow_state = state
+                    self._follow_offset = end
+            else:
+                ret = self._parse_file_fast(f)
+            if ret is None:
+                logging.debug('Unable to parse %s in chunks, parsing lines',
+                        filepath)
+                if self._follow:
+                    logging.warning('Unable to follow %s', filepath)
+                f.seek(0)
+                ret = self._parse_file_lines(f)
+        finally:
+            f.close()
+
+        data, nfields, blocksize = ret
+        if cache:
+            datacache.save(filepath, key,
+                    self._get_file_info(nfields, blocksize), data,
+                    config.get('data_cachedir', None))
+
+        self._set_loaded_data(data, nfields, blocksize)
+        return True
+
+    def _get_file_info(self, nfields, blocksize):
+        '''
+        Return the header information parsed from the data file as a
+        picklable dictionary, see _set_file_info().
+        '''
+
+        return {
+            'dimensions': copy.deepcopy(self._dimensions),
+            'comment': self._comment,
+            'block_sizes': self._block_sizes,
+            'block_starts': self._block_starts,
+            'npoints_max_block': self._npoints_max_block,
+            'nfields': nfields,
+            'blocksize': blocksize,
+        }
+
+    def _set_file_info(self, info, data):
+        '''Set header information from _get_file_info() and data.'''
+
+        self._reset_file_info()
+        self._dimensions = info['dimensions']
+        self._comment = info['comment']
+        self._block_sizes = info['block_sizes']
+        self._block_starts = info['block_starts']
+        self._npoints_max_block = info['npoints_max_block']
+
+        self._set_loaded_data(data, info['nfields'], info['blocksize'])
+
+    def refresh(self):
+        '''
+        Load data added to the data file since it was loaded or refreshed.
+        For Data objects created with follow=True only the complete lines
+        appended since are parsed and added; otherwise the file is loaded
+        again.
+
+        Output:
+            The number of new data points, or None on failure.
+        '''
+
+        npoints = self._npoints
+        filepath = self.get_filepath()
+        if self._follow_state is None or self._follow_state['nfields'] is None:
+            if not self._load_file():
+                return None
+            return self._npoints - npoints
+
+        try:
+            f = open(filepath, 'rb')
+            try:
+                size = os.path.getsize(filepath)
+                if size < self._follow_offset:
+                    logging.info('File %s was truncated, loading again',
+                            filepath)
+                    if not self._load_file():
+                        return None
+                    return self._npoints
+                f.seek(self._follow_offset)
+                text = f.read(size - self._follow_offset)
+            finally:
+                f.close()
+        except IOError, e:
+            logging.warning('Unable to read %s: %s', filepath, e)
+            return None
+
+        text = text[:text.rfind('\n') + 1]
+        if len(text) == 0:
+            return 0
+
+        # The lines are consumed even if they can not be parsed, so they
+        # are not read again by the next refresh.
+        self._follow_offset += len(text)
+        lines = text.splitlines(True)
+        state = self._follow_state
+        state['ends'] = []
+        state['meta'] = False
+        values = self._parse_data_chunk(lines, state)
+        if values is None:
+            logging.warning('Unable to parse new lines of %s, skipping them',
+                    filepath)
+            return None
+
+        for line in lines:
+            if '#' in line:
+                self._parse_meta_data(line.rstrip(' \n\t\r'))
+        rows = values.reshape((-1, state['nfields']))
+        self._add_loaded_rows(rows, state['ends'])
+        return len(rows)
+
+    def _add_loaded_rows(self, rows, ends):
+        '''
+        Add rows read from the file to the in-memory data, with 'ends' the
+        row numbers of new block ends.
+        '''
+
+        if len(rows) == 0 and len(ends) == 0:
+            return
+
+        self._store.append(rows)
+        self._npoints += len(rows)
+        if self._stats_valid:
+            self._stats.update(rows)
+
+        self._block_starts = numpy.concatenate((self._block_starts, ends))
+        sizes = numpy.diff(self._block_starts)
+        self._block_sizes = sizes.tolist()
+        if len(sizes) > 0:
+            self._npoints_max_block = int(sizes.max())
+        self._npoints_last_block = self._npoints - int(self._block_starts[-1])
+        if self._npoints_last_block > self._npoints_max_block:
+            self._npoints_max_block = self._npoints_last_block
+
+        try:
+            self._detect_dimensions_size()
+        except Exception, e:
+            logging.warning('Error while detecting dimension size')
+        _memory.check()
+
+        if len(ends) > 0:
+            self.emit('new-data-block')
+        else:
+            self.emit('new-data-point')
+
+    def _is_binary_file(self, filepath):
+        try:
+            f = open(filepath, 'rb')
+            try:
+                return f.read(len(self._BINARY_MAGIC)) == self._BINARY_MAGIC
+            finally:
+                f.close()
+        except IOError:
+            return False
+
+    def _load_binary_file(self):
+        '''
+        Load a binary data file, see create_file() for the format. The rows
+        are memory-mapped; a partially written last row is ignored.
+        '''
+
+        self._reset_file_info()
+        ret = self._map_binary_file()
+        if ret is None:
+            return False
+        data, ends = ret
+        nrows = len(data)
+
+        sizes = numpy.diff([0] + ends)
+        self._block_sizes = sizes.tolist()
+        self._block_starts = numpy.array([0] + ends)
+        if len(sizes) > 0:
+            self._npoints_max_block = int(sizes.max())
+        if len(ends) > 0:
+            blocksize = nrows - ends[-1]
+        else:
+            blocksize = nrows
+
+        self._set_loaded_data(data, data.shape[1], blocksize)
+        return True
+
+    def _map_binary_file(self, meta=True):
+        '''
+        Memory-map the rows of a binary data file. The header and comments
+        are parsed as meta data if 'meta' is True.
+
+        Output:
+            (data, block ends) or None on failure.
+        '''
+
+        filepath = self.get_filepath()
+        try:
+            f = open(filepath, 'rb')
+            try:
+                first = f.readline()
+                magic, size, ncols, dtype = first.split()
+                size = int(size)
+                ncols = int(ncols)
+                header = f.read(size - len(first))
+            finally:
+                f.close()
+            dtype = numpy.dtype(dtype)
+        except Exception, e:
+            logging.warning('Unable to read binary file %s: %s', filepath, e)
+            return None
+
+        if meta:
+            for line in header.split('\n'):
+                line = line.rstrip(' \t\r')
+                if line.startswith('#'):
+                    self._parse_meta_data(line)
+
+        nrows = (os.path.getsize(filepath) - size) / (dtype.itemsize * ncols)
+        if nrows > 0:
+            data = numpy.memmap(filepath, dtype=dtype, mode='c',
+                    offset=size, shape=(nrows, ncols))
+        else:
+            data = numpy.zeros((0, ncols), dtype=dtype)
+
+        ends = []
+        fn = self.get_block_index_filepath()
+        if os.path.exists(fn):
+            f = open(fn, 'r')
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                key, val = line.rstrip('\n').split(' ', 1)
+                if key == 'block':
+                    ends.append(min(int(val), nrows))
+                elif key == 'comment' and meta:
+                    self._comment.append(' ' + val)
+            f.close()
+
+        self._backend = 'binary'
+        self._binary_dtype = dtype
+        self._binary_header_size = size
+        return data, [e for e in ends if e > 0]
+
+    def _load_hdf5_file(self):
+        '''
+        Load an HDF5 data file, see lib/file_support/datahdf5.py. Files
+        that are still being written can be loaded as well.
+        '''
+
+        self._reset_file_info()
+        info = self._read_hdf5_file()
+        if info is None:
             return False
+        data, ends = info['data'], info['ends']
+
+        sizes = numpy.diff([0] + ends)
+        self._block_sizes = sizes.tolist()
+        self._block_starts = numpy.array([0] + ends)
+        if len(sizes) > 0:
+            self._npoints_max_block = int(sizes.max())
+        if len(ends) > 0:
+            blocksize = len(data) - ends[-1]
+        else:
+            blocksize = len(data)
+
+        self._set_loaded_data(data, info['ncols'], blocksize)
+        return True
+
+    def _read_hdf5_file(self, data=True, meta=True):
+        '''
+        Read an HDF5 data file, parsing the header and comments as meta data
+        if 'meta' is True. Returns the info from datahdf5.read_file().
+        '''
+
+        if not datahdf5.is_available():
+            logging.warning('Unable to read %s without h5py',
+                    self.get_filepath())
+            return None
+
+        info = datahdf5.read_file(self.get_filepath(), data=data)
+        if info is None:
+            return None
+
+        if meta:
+            for line in info['header'].split('\n'):
+                line = line.rstrip(' \t\r')
+                if line.startswith('#'):
+                    self._parse_meta_data(line)
+            self._comment.extend([' ' + c for c in info['comments']])
+
+        self._backend = 'hdf5'
+        info['ends'] = [e for e in info['ends'] if e > 0]
+        return info
 
+    def _load_cache(self):
+        '''
+        Load data and header information from the cache, return False if
+        no valid cache entry is available.
+        '''
+
+        ret = datacache.load(self.get_filepath(),
+                config.get('data_cachedir', None))
+        if ret is None:
+            return False
+
+        info, data = ret
+        self._set_file_info(info, data)
+        return True
+
+    def _set_loaded_data(self, data, nfields, blocksize):
+        '''Store data parsed from a file and determine its dimensions.'''
+
+        self._add_missing_dimensions(nfields)
+        self._count_coord_val_dims()
+
+        self._data = data
+        dtypes = self._get_column_dtypes()
+        if dtypes is not None and len(dtypes) == nfields and \
+                not isinstance(data, numpy.memmap):
+            self._store = _ColumnStore(dtypes)
+            self._store.set(data)
+        self._npoints = len(self._data)
+        self._inmem = True
+        _memory.check()
+
+        self._npoints_last_block = blocksize
+        if blocksize > self._npoints_max_block:
+            self._npoints_max_block = blocksize
+
+        try:
+            self._detect_dimensions_size()
+        except Exception, e:
+            logging.warning('Error while detecting dimension size')
+
+    def _reset_file_info(self):
         self._dimensions = []
+        self._column_formats = None
         self._values = []
         self._comment = []
-        data = []
-        nfields = 0
 
         self._block_sizes = []
+        self._block_starts = numpy.array([0])
         self._npoints = 0
         self._npoints_last_block = 0
         self._npoints_max_block = 0
 
+    def _parse_file_lines(self, f):
+        '''
+        Parse data file f line by line.
+        Returns a tuple (data, number of fields, size of last block).
+        '''
+
+        self._reset_file_info()
+        data = []
+        nfields = 0
         blocksize = 0
+        block_starts = [0]
 
         for line in f:
             line = line.rstrip(' \n\t\r')
@@ -1050,6 +3070,7 @@ class Data(SharedGObject):
             # Count blocks
             if len(line) == 0 and len(data) > 0:
                 self._block_sizes.append(blocksize)
+                block_starts.append(len(data))
                 if blocksize > self._npoints_max_block:
                     self._npoints_max_block = blocksize
                 blocksize = 0
@@ -1069,21 +3090,162 @@ class Data(SharedGObject):
                 data.append(fields)
                 blocksize += 1
 
-        self._add_missing_dimensions(nfields)
-        self._count_coord_val_dims()
+        self._block_starts = numpy.array(block_starts)
+        return numpy.array(data), nfields, blocksize
 
-        self._data = numpy.array(data)
-        self._npoints = len(self._data)
-        self._inmem = True
+    def _parse_file_fast(self, f, state=None):
+        '''
+        Parse data file f in two phases: first the header lines are parsed
+        for meta data, then the body is parsed in chunks by
+        _parse_data_chunk(). The parse state is kept in dictionary 'state'
+        if given.
 
-        self._npoints_last_block = blocksize
+        Returns a tuple (data, number of fields, size of last block), or
+        None if the file could not be parsed this way.
+        '''
 
-        try:
-            self._detect_dimensions_size()
-        except Exception, e:
-            logging.warning('Error while detecting dimension size')
+        self._reset_file_info()
+
+        # Phase 1: header
+        line = self._parse_header_lines(f)
+
+        # Phase 2: body, starting with the first data line
+        if state is None:
+            state = {}
+        state.update({
+            'nfields': None,
+            'npoints': 0,
+            'ends': [],
+            'last_end': 0,
+        })
+        chunks = []
+        if line != '':
+            lines = [line] + f.readlines(self._LOAD_CHUNK)
+        else:
+            lines = []
+        while len(lines) > 0:
+            chunk = self._parse_data_chunk(lines, state)
+            if chunk is None:
+                return None
+            chunks.append(chunk)
+            lines = f.readlines(self._LOAD_CHUNK)
+
+        nfields = state['nfields']
+        if nfields is None:
+            return numpy.array([]), 0, 0
+        data = numpy.concatenate(chunks).reshape((-1, nfields))
+
+        # Block boundaries; every run of blank lines after the first data
+        # point ends a block.
+        ends = numpy.array(state['ends'], dtype=numpy.int64)
+        sizes = numpy.diff(numpy.concatenate(([0], ends)))
+        self._block_sizes = sizes.tolist()
+        self._block_starts = numpy.concatenate(([0], ends))
+        if len(sizes) > 0:
+            self._npoints_max_block = int(sizes.max())
+        if len(ends) > 0:
+            blocksize = len(data) - int(ends[-1])
+        else:
+            blocksize = len(data)
 
-        return True
+        return data, nfields, blocksize
+
+    def _parse_header_lines(self, f, meta=True):
+        '''
+        Read the header of text data file f, parsing comments as meta data
+        if 'meta' is True. Returns the first data line, or '' at the end of
+        the file.
+        '''
+
+        line = f.readline()
+        while line != '':
+            stripped = line.rstrip(' \n\t\r')
+            commentpos = stripped.find('#')
+            if commentpos == -1:
+                fields = stripped
+            else:
+                fields = stripped[:commentpos]
+            if len(fields.split()) > 0:
+                break
+
+            if commentpos != -1 and meta:
+                self._parse_meta_data(stripped)
+            line = f.readline()
+
+        return line
+
+    def _parse_data_chunk(self, lines, state):
+        '''
+        Parse a list of complete lines from the body of a data file and
+        return the values as a 1D array, which is empty if the lines do not
+        contain data. The number of fields, number of
+        points and block ends seen so far are kept in dictionary 'state'.
+
+        Comments are parsed as meta data unless state['meta'] is False.
+
+        Returns None if the chunk does not contain a consistent number of
+        fields per line.
+        '''
+
+        text = ''.join(lines)
+        if not text.endswith('\n'):
+            text += '\n'
+        buf = numpy.frombuffer(text, dtype=numpy.uint8)
+
+        newline = (buf == 10)
+        lineends = numpy.flatnonzero(newline)
+        nlines = len(lineends)
+
+        # Text after a '#' is a comment; such lines are never block
+        # separators.
+        commentlines = numpy.zeros(nlines, dtype=bool)
+        hashpos = numpy.flatnonzero(buf == 35)
+        if len(hashpos) > 0:
+            buf = buf.copy()
+            for i in numpy.unique(numpy.searchsorted(lineends, hashpos)):
+                if state.get('meta', True):
+                    self._parse_meta_data(lines[i].rstrip(' \n\t\r'))
+                start = hashpos[numpy.searchsorted(hashpos,
+                    lineends[i - 1] + 1 if i > 0 else 0)]
+                buf[start:lineends[i]] = 32
+                commentlines[i] = True
+            text = buf.tostring()
+
+        space = newline | (buf == 32) | (buf == 9) | (buf == 13)
+        tokstart = ~space
+        tokstart[1:] &= space[:-1]
+        ntokens = numpy.bincount(
+                numpy.searchsorted(lineends, numpy.flatnonzero(tokstart)),
+                minlength=nlines)
+
+        isdata = ntokens > 0
+        if isdata.any():
+            nfields = ntokens[isdata]
+            if state['nfields'] is None:
+                state['nfields'] = int(nfields[0])
+            if (nfields != state['nfields']).any():
+                return None
+
+        # fromstring() does not return an empty array for text without
+        # tokens, e.g. a chunk of blank lines and comments
+        if ntokens.sum() == 0:
+            values = numpy.zeros(0, dtype=numpy.float64)
+        else:
+            values = numpy.fromstring(text, dtype=numpy.float64, sep=' ')
+            if len(values) != int(ntokens.sum()):
+                return None
+
+        blank = ~isdata & ~commentlines
+        npoints = state['npoints'] + numpy.cumsum(isdata)
+        ends = numpy.unique(npoints[blank])
+        ends = ends[ends > state['last_end']]
+        if len(ends) > 0:
+            state['last_end'] = int(ends[-1])
+        state['ends'].extend(ends.tolist())
+        state['npoints'] = int(npoints[-1]) if nlines > 0 else \
+                state['npoints']
+
+        return values
 
     def _type_added(self, name):
         if name == 'coordinate':
@@ -1132,17 +3294,41 @@ class Data(SharedGObject):
         '''
         Return a reshaped version of the data. This is not guaranteed to be
         a view to the same data object.
+
+        Snake (sweep back) loops are put in raster order. If the last sweep
+        is incomplete the missing points are filled with NaN.
         '''
 
+        if isinstance(self._store, _GridStore):
+            return self._store.get_grid()
+
         if self._reshaped_data is not None:
             return self._reshaped_data
 
         loopdims = copy.copy(self._loopdims)
         newshape = copy.copy(self._loopshape)
-        if not self._complete or None in (loopdims, newshape):
+        if None in (loopdims, newshape) or len(loopdims) == 0:
             return None
 
         data = self._data
+        ntotal = int(numpy.prod(newshape))
+        if len(data) < ntotal:
+            pad = numpy.empty((ntotal - len(data), data.shape[1]))
+            pad.fill(numpy.nan)
+            data = numpy.concatenate((data, pad))
+        elif len(data) > ntotal:
+            return None
+
+        # Reverse every other pass of snake loops
+        stride = 1
+        for i, snake in enumerate(self._loopsnake):
+            if snake:
+                if data is self._data:
+                    data = data.copy()
+                passes = data.reshape((-1, newshape[i], stride, data.shape[1]))
+                passes[1::2] = passes[1::2, ::-1].copy()
+                data = passes.reshape((ntotal, -1))
+            stride *= newshape[i]
 
         cshape_ok, fshape_ok = True, True
         for i in range(len(loopdims)):
@@ -1166,9 +3352,53 @@ class Data(SharedGObject):
         self._reshaped_data = data
         return self._reshaped_data
 
+    def _detect_loop_size(self, col):
+        '''
+        Detect the size of a loop from the values of its coordinate at the
+        start of each step, col. col[0] and col[1] should differ.
+
+        Output:
+            (size, snake), with snake True if the loop runs back and forth.
+            If the loop did not complete, size is the length of col.
+        '''
+
+        n = len(col)
+        size = n
+        # Search in growing windows, loops are usually much shorter than
+        # the data set.
+        window = 1024
+        start = 1
+        while start < n:
+            match = numpy.flatnonzero(col[start:start + window] == col[0])
+            if len(match) > 0:
+                size = start + int(match[0])
+                break
+            start += window
+            window *= 8
+
+        # A sweep back starts by repeating the last value
+        repeat = numpy.flatnonzero(col[1:size] == col[:size - 1])
+        if len(repeat) > 0:
+            back = int(repeat[0]) + 1
+            nback = min(back, n - back)
+            if numpy.all(col[back:back + nback] == col[back - nback:back][::-1]):
+                return back, True
+
+        return size, False
+
     def _detect_dimensions_size(self):
+        '''
+        Detect the loop structure of the data: which coordinates are looped
+        in which order, the size of each loop and whether loops are snake
+        shaped. The block sizes found while parsing the file are kept.
+
+        Output:
+            True if the last sweep was complete.
+        '''
+
         data = self._data
         ncoords = self.get_ncoordinates()
+        self._reshaped_data = None
         if len(data) < 2:
             for colnum in range(ncoords):
                 self._dimensions[colnum]['size'] = len(data)
@@ -1176,88 +3406,259 @@ class Data(SharedGObject):
 
         loopdims = []
         newshape = []
+        snakes = []
         mulsize = 1
-        firstloopdim = None
-        for iter in range(ncoords):
-            loopdim = None
-            for colnum in range(ncoords):
-                if mulsize >= len(data):
-                    continue
-
-                if data[0, colnum] != data[mulsize, colnum]:
-                    loopdim = colnum
-                    loopdims.append(loopdim)
-                    loopstart = data[0, loopdim]
-                    break
-
-            if loopdim is None:
+        while mulsize < len(data):
+            first = data[0, :ncoords]
+            changed = numpy.flatnonzero(first != data[mulsize, :ncoords])
+            changed = [c for c in changed if c not in loopdims]
+            if len(changed) == 0:
                 break
 
-            if firstloopdim is None:
-                firstloopdim = loopdim
-
-            i = 1
-            while i * mulsize < len(data):
-                if data[i * mulsize, loopdim] == loopstart:
-                    break
-                i += 1
+            loopdim = int(changed[0])
+            col = data[::mulsize, loopdim]
+            size, snake = self._detect_loop_size(col)
 
             opt = self._dimensions[loopdim]
-            opt['start'] = loopstart
-            opt['size'] = i
-            opt['end'] = data[mulsize * (i - 1), loopdim]
-            newshape.append(i)
+            opt['start'] = data[0, loopdim]
+            opt['size'] = size
+            opt['end'] = data[mulsize * (size - 1), loopdim]
 
-            mulsize *= i
+            loopdims.append(loopdim)
+            newshape.append(size)
+            snakes.append(snake)
+            mulsize *= size
 
-        complete = len(self._data) == mulsize
+        complete = len(data) == mulsize
         self._loopdims = loopdims
         self._loopshape = newshape
+        self._loopsnake = snakes
         self._complete = complete
-
-        # Determine number of blocks
-        bs = self._dimensions[firstloopdim]['size']
-        if bs > 0:
-            if len(data) % bs == 0:
-                self._block_sizes = [bs] * (len(data) / bs)
-            else:
-                self._block_sizes = [bs] * (int(len(data) / bs) + 1)
-
         return complete
 
     def set_filepath(self, fp, inmem=True):
         '''
         Set the filepath associated with the data.
         If inmem is True it will be loaded directly.
-        If fp is a directory, a file with extension .dat will be searched for.
+        If fp is a directory, a file with extension .dat or .bin will be
+        searched for.
         '''
 
         if os.path.isdir(fp):
             files = os.listdir(fp)
             foundfile = None
             for fn in files:
-                if os.path.splitext(fn)[1] == '.dat':
+                if os.path.splitext(fn)[1] in ('.dat', '.bin', '.hdf5'):
                     if foundfile is not None:
-                        raise ValueError('Multiple .dat files in directory, Unable to decide which one to load')
+                        raise ValueError('Multiple data files in directory, Unable to decide which one to load')
                     foundfile = fn
             if foundfile is None:
-                raise ValueError('No .dat file found in directory')
+                raise ValueError('No .dat, .bin or .hdf5 file found in directory')
 
             self._dir, self._filename = fp, foundfile
 
         else:
             self._dir, self._filename = os.path.split(fp)
 
+        self._index = None
+        self._pyramid = None
         if inmem:
             if self._load_file():
                 self._inmem = True
             else:
                 self._inmem = False
 
+### Streaming
+
+    # Number of rows per chunk when streaming data from memory or a binary
+    # file.
+    _STREAM_ROWS = 65536
+
+    def _open_text_file(self):
+        '''Open the data file for reading, gzipped files are supported.'''
+
+        filepath = self.get_filepath()
+        if filepath.endswith('.gz'):
+            return gzip.open(filepath, 'rb')
+        if not os.path.exists(filepath) and os.path.exists(filepath + '.gz'):
+            return gzip.open(filepath + '.gz', 'rb')
+        return open(filepath, 'rb')
+
+    def _iter_raw(self):
+        '''
+        Generate (rows, ends) tuples covering the data set in order, with
+        'ends' the row numbers of the block ends in or directly after
+        'rows'. If the data is not in memory it is read from the file;
+        without dimension information the header is parsed as well.
+        '''
+
+        meta = len(self._dimensions) == 0
+        if self._file is not None:
+            self.flush()
+
+        if self._inmem:
+            data = self._data
+            ends = self._get_block_ends()
+        elif self._is_binary_file(self.get_filepath()):
+            ret = self._map_binary_file(meta=meta)
+            if ret is None:
+                return
+            data, ends = ret
+            if meta:
+                self._count_coord_val_dims()
+        elif datahdf5.is_hdf5_file(self.get_filepath()):
+            if self._read_hdf5_file(data=False, meta=meta) is None:
+                return
+            if meta:
+                self._count_coord_val_dims()
+            for rows, ends in datahdf5.iter_rows(self.get_filepath(),
+                    self._STREAM_ROWS):
+                yield rows, ends
+            return
+        else:
+            data = None
+
+        if data is not None:
+            for start in xrange(0, len(data), self._STREAM_ROWS):
+                rows = data[start:start + self._STREAM_ROWS]
+                stop = start + len(rows)
+                yield rows, [e for e in ends if start < e <= stop]
+            return
+
+        f = self._open_text_file()
+        try:
+            line = self._parse_header_lines(f, meta=meta)
+            if meta:
+                self._count_coord_val_dims()
+
+            state = {
+                'nfields': None,
+                'npoints': 0,
+                'ends': [],
+                'last_end': 0,
+                'meta': False,
+            }
+            if line != '':
+                lines = [line] + f.readlines(self._LOAD_CHUNK)
+            else:
+                lines = []
+            while len(lines) > 0:
+                values = self._parse_data_chunk(lines, state)
+                if values is None:
+                    raise ValueError('Unable to parse %s' % \
+                            self.get_filepath())
+                if state['nfields'] is not None:
+                    yield values.reshape((-1, state['nfields'])), \
+                            state['ends']
+                state['ends'] = []
+                lines = f.readlines(self._LOAD_CHUNK)
+        finally:
+            f.close()
+
+    def read_header(self):
+        '''
+        Read the dimension information and comments from the header of the
+        data file, without loading the data. Meant for Data objects created
+        with inmem=False; information about loaded data is reset.
+        '''
+
+        self._reset_file_info()
+        if self._is_binary_file(self.get_filepath()):
+            if self._map_binary_file() is None:
+                return False
+        elif datahdf5.is_hdf5_file(self.get_filepath()):
+            if self._read_hdf5_file(data=False) is None:
+                return False
+        else:
+            f = self._open_text_file()
+            try:
+                self._parse_header_lines(f)
+            finally:
+                f.close()
+
+        self._count_coord_val_dims()
+        return True
+
+    def iter_chunks(self, nrows=None):
+        '''
+        Generate the data as 2D arrays of nrows rows (the last one can be
+        shorter), without loading all data in memory. Text, gzipped text,
+        binary and HDF5 data files are supported. If nrows is None the
+        chunks have the size in which the data is read.
+        '''
+
+        pending = []
+        npending = 0
+        for rows, ends in self._iter_raw():
+            if nrows is None:
+                yield rows
+                continue
+
+            pending.append(rows)
+            npending += len(rows)
+            while npending >= nrows:
+                buf = _concatenate(pending)
+                yield buf[:nrows]
+                pending = [buf[nrows:]]
+                npending -= nrows
+
+        if npending > 0:
+            yield _concatenate(pending)
+
+    def iter_blocks(self):
+        '''
+        Generate (info, rows) tuples for all blocks in the data, without
+        loading all data in memory. Text, gzipped text, binary and HDF5 data
+        files are supported. Empty blocks are skipped.
+
+        'info' is a dictionary with:
+            block: the block number
+            start: the number of the first row in the block
+            npoints: the number of rows
+            coordinates: (first, last) value of every coordinate column
+        '''
+
+        blockid = 0
+        blockstart = 0
+        row = 0
+        pending = []
+        for rows, ends in self._iter_raw():
+            pos = 0
+            for end in ends:
+                pending.append(rows[pos:end - row])
+                pos = end - row
+                block = _concatenate(pending)
+                pending = []
+                if len(block) > 0:
+                    yield self._get_block_info(blockid, blockstart, block), \
+                            block
+                blockid += 1
+                blockstart = end
+
+            pending.append(rows[pos:])
+            row += len(rows)
+
+        if len(pending) > 0:
+            block = _concatenate(pending)
+            if len(block) > 0:
+                yield self._get_block_info(blockid, blockstart, block), block
+
+    def _get_block_info(self, blockid, start, rows):
+        coords = []
+        for i in range(min(self.get_ncoordinates(), rows.shape[1])):
+            coords.append((rows[0, i], rows[-1, i]))
+        return {
+            'block': blockid,
+            'start': start,
+            'npoints': len(rows),
+            'coordinates': coords,
+        }
+
 ### Misc
 
     def _stop_request_cb(self, sender):
         '''Called when qtflow emits a stop-request.'''
+        self.flush()
         self.close_file()
 
     @staticmethod
@@ -1268,7 +3669,181 @@ class Data(SharedGObject):
     def get(name):
         return Data._data_list.get(name)
 
+    @staticmethod
+    def get_memory_report():
+        '''
+        Return the memory usage of all Data objects, see
+        _MemoryBudget.get_report().
+        '''
+        return _memory.get_report()
+
+    def get_memory_usage(self):
+        '''
+        Return a dictionary with the name of this data object, its number
+        of points, the number of bytes of data held in memory and whether
+        the data has been spilled to disk.
+        '''
+
+        return {
+            'name': self._name,
+            'npoints': self._npoints,
+            'nbytes': self._store.get_nbytes(),
+            'spilled': self._store.is_spilled(),
+        }
+
+    def _can_spill(self):
+        return self._inmem and self._file is None and \
+                self._store.get_nbytes() > 0
+
+    def _spill(self):
+        '''Move the in-memory data to a memory-mapped file.'''
+
+        try:
+            filepath = _memory.get_spill_filepath(self)
+            files = self._store.spill(filepath)
+        except (IOError, OSError), e:
+            logging.warning('Unable to spill data %s: %s', self._name, e)
+            return False
+
+        _memory.remove_spillfiles(self._spillfiles)
+        self._spillfiles = files
+        _memory.add_spillfiles(files)
+        self._reshaped_data = None
+        logging.debug('Spilled data %s to %s', self._name, filepath)
+        return True
+
 def slice(data, coords, vals):
     """
-    Return new data object with a slice of the given data set
+    Return new data object with a slice of the given data set: coordinate
+    columns 'coords' and value columns 'vals'. The data is read block by
+    block, so only the slice has to fit in memory.
     """
+
+    dims = data.get_dimensions()
+    ret = Data(name='%s_slice' % data.get_name(), inmem=True, infile=False)
+    for cols, add in ((coords, ret.add_coordinate), (vals, ret.add_value)):
+        for col in cols:
+            info = dict(dims[col])
+            name = info.pop('name', 'col%d' % (col + 1))
+            info.pop('type', None)
+            add(name, **info)
+
+    cols = list(coords) + list(vals)
+    for info, rows in data.iter_blocks():
+        ret.add_data_point(rows[:, cols])
+        ret.new_block()
+
+    return ret
+
+def _parse_file_worker(filepath):
+    '''
+    Parse a text data file in a worker process of load_many().
+
+    Output:
+        (info, data) tuple, None if the file should be loaded by the
+        calling process (binary files and valid cache entries are memory
+        mapped, HDF5 files are read directly, which is faster than sending
+        them between processes) or an error message.
+    '''
+
+    try:
+        d = Data(filepath, inmem=False)
+        if d._is_binary_file(filepath) or datahdf5.is_hdf5_file(filepath):
+            return None
+        if d._cache and datacache.load(filepath,
+                config.get('data_cachedir', None)) is not None:
+            return None
+        if not d._load_file():
+            return 'Unable to load %s' % filepath
+        data = numpy.asarray(d.get_data())
+        info = d._get_file_info(data.shape[1] if data.ndim == 2 else 0,
+                d._npoints_last_block)
+        return info, data
+    except Exception, e:
+        return 'Unable to load %s: %s' % (filepath, e)
+
+def _can_use_processes():
+    '''
+    Return whether load_many() can use worker processes. On Windows these
+    import the __main__ module, which is not possible from an interactive
+    shell and would start qtlab again inside qtlab.
+    '''
+
+    if os.name != 'nt':
+        return True
+    if in_qtlab:
+        return False
+    main = sys.modules.get('__main__')
+    return os.path.isfile(getattr(main, '__file__', ''))
+
+def load_many(paths, workers=None, stack=False):
+    '''
+    Load many data files, parsing text files in parallel in a pool of
+    worker processes. Binary files and files with a valid cache entry (see
+    the 'cache' option of Data) are memory-mapped, and HDF5 files are read,
+    in this process.
+
+    Where worker processes can not be started, on Windows inside qtlab or
+    from an interactive shell, a pool of threads is used instead.
+
+    Input:
+        paths (list): data file paths
+        workers (int): number of workers, default is 'data_load_workers'
+            from config, or else 1 inside qtlab and the number of CPUs
+            outside it. With 1 worker the files are loaded in this
+            process.
+        stack (bool): return a single array of shape (files, points,
+            columns) if all files have data of the same shape.
+
+    Output:
+        list of Data objects, with None for files that could not be loaded,
+        or a numpy.array if 'stack' is True and the shapes match.
+    '''
+
+    paths = list(paths)
+    if workers is None:
+        workers = config.get('data_load_workers', None)
+    if workers is None:
+        if in_qtlab:
+            workers = 1
+        else:
+            workers = multiprocessing.cpu_count()
+    workers = min(workers, len(paths))
+
+    if workers > 1:
+        if _can_use_processes():
+            pool = multiprocessing.Pool(workers)
+        else:
+            pool = multiprocessing.pool.ThreadPool(workers)
+        try:
+            results = pool.map(_parse_file_worker, paths, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [None] * len(paths)
+
+    ret = []
+    for filepath, result in zip(paths, results):
+        if isinstance(result, str):
+            logging.warning(result)
+            ret.append(None)
+            continue
+
+        if result is None:
+            d = Data(filepath)
+            if not d._inmem:
+                logging.warning('Unable to load %s', filepath)
+                d = None
+        else:
+            d = Data(filepath, inmem=False)
+            d._set_file_info(*result)
+        ret.append(d)
+
+    if stack:
+        shapes = set([numpy.shape(d.get_data()) for d in ret if d is not None])
+        if None not in ret and len(shapes) == 1:
+            return numpy.array([d.get_data() for d in ret])
+        logging.warning('Data shapes differ, not stacking')
+
+    return ret
@@ -59,8 +59,16 @@ class DataGroup(SharedGObject):
     At the moment this does not have too many improvements over using just the
     bare container, but the concept should be useful for plotting, ensuring
     correct dimensionalities, etc.
+
+    Dimensions added with stream=True are chunked, resizable datasets that
+    grow while a measurement runs, see append() and add_data_point(). Their
+    number of valid rows is kept in the 'nrows' attribute, as the dataset
+    itself grows in steps of whole chunks and is only cut to size by
+    close().
     """
 
+    _STREAM_CHUNK = 1024
+
     def __init__(self, name, hdf5_data, base='/', **kw):
         self.name = name
         self.h5d = hdf5_data._file
@@ -78,18 +86,54 @@ class DataGroup(SharedGObject):
         for k in kw:
             self.group.attrs[k] = kw[k]
 
+        self._streams = []
+        self._datasets = {}
+        self._nrows = {}
+        self._buffers = {}
+        self._nbuffered = {}
+        self._nunflushed = 0
+        self._last_flush = time.time()
+        self.set_flush_policy(rows=config.get('hdf5_flush_rows', None),
+                interval=config.get('hdf5_flush_interval', 1.0))
+
     def __getitem__(self, name):
         return self.group[name].value
 
     def __setitem__(self, name, val):
         if name in self.group.keys():
 
+            # write in place if the dataset can hold the new data
+            dset = self.group[name]
+            val = np.asarray(val)
+            if name in self._buffers:
+                self._buffers[name] = []
+                self._nbuffered[name] = 0
+            if dset.dtype == val.dtype and len(dset.shape) == val.ndim:
+                if dset.shape != val.shape and dset.chunks is not None and \
+                        all([m is None or m >= n for m, n in \
+                            zip(dset.maxshape, val.shape)]):
+                    dset.resize(val.shape)
+                if dset.shape == val.shape:
+                    dset[...] = val
+                    if name in self._nrows:
+                        self._nrows[name] = len(val)
+                        dset.attrs['nrows'] = len(val)
+                    return True
+
             # store old attributes
             attrs = dict(self.group[name].attrs)
 
             # delete and re-create; overwrite doesn't work with hdf5
             del self.group[name]
-            dim = self.group.create_dataset(name, data=val)
+            if name in self._datasets:
+                dim = self.group.create_dataset(name, data=val,
+                        maxshape=(None, ) + val.shape[1:],
+                        chunks=(self._STREAM_CHUNK, ) + val.shape[1:])
+                self._datasets[name] = dim
+                self._nrows[name] = len(val)
+                attrs['nrows'] = len(val)
+            else:
+                dim = self.group.create_dataset(name, data=val)
             for k, v in attrs.iteritems():
                 dim.attrs[k] = v
 
@@ -107,11 +151,14 @@ class DataGroup(SharedGObject):
     def get_folder(self):
         return self._folder
 
-    def add_dimension(self, name, dim_type, data, **meta):
+    def add_dimension(self, name, dim_type, data, stream=False,
+            rowshape=(), dtype=np.float64, **meta):
         '''
         Add a dimension to the data group.
         dim_type is not restricted, but 'coordinate' and 'value' should be
         used to specify what the dimension represents.
+        If stream is True, the dimension is a resizable dataset that rows
+        of shape rowshape are appended to, starting with data if given.
         Extra keywords are added as meta data.
         '''
 
@@ -120,10 +167,28 @@ class DataGroup(SharedGObject):
                     % (name, self.name))
             return False
 
-        if data is None:
-            data = np.array([np.NaN])
+        if stream:
+            if data is not None:
+                data = np.asarray(data)
+                rowshape = data.shape[1:]
+                dtype = data.dtype
+            rowshape = tuple(rowshape)
+            dim = self.group.create_dataset(name, shape=(0, ) + rowshape,
+                    maxshape=(None, ) + rowshape, dtype=dtype,
+                    chunks=(self._STREAM_CHUNK, ) + rowshape)
+            dim.attrs['nrows'] = 0
+            self._streams.append(name)
+            self._datasets[name] = dim
+            self._nrows[name] = 0
+            self._buffers[name] = []
+            self._nbuffered[name] = 0
+            if data is not None:
+                self.append(name, data)
+        else:
+            if data is None:
+                data = np.array([np.NaN])
+            dim = self.group.create_dataset(name, data=data)
 
-        dim = self.group.create_dataset(name, data=data)
         dim.attrs['dim_type'] = dim_type
 
         for k in meta:
@@ -152,6 +217,144 @@ class DataGroup(SharedGObject):
         '''
         return self.add_dimension(name, 'value', data, **meta)
 
+    def set_flush_policy(self, rows=None, interval=None):
+        '''
+        Set when appended rows are flushed to disk: when the number of rows
+        appended since the last flush, or the time in seconds since the
+        last flush, reaches the given limit. A limit of None disables that
+        check, 0 flushes after every append.
+        '''
+
+        self._flush_policy = {
+            'rows': rows,
+            'interval': interval,
+        }
+
+    def get_flush_policy(self):
+        '''Return the flush policy, see set_flush_policy().'''
+        return self._flush_policy
+
+    def get_nrows(self, name):
+        '''Return the number of rows of a dimension, including buffered ones.'''
+        if name in self._nrows:
+            return self._nrows[name] + self._nbuffered[name]
+        return len(self.group[name])
+
+    def get_rows(self, name, start=0, stop=None):
+        '''Return rows start up to stop of a dimension.'''
+        self._write_buffers()
+        start, stop, step = slice(start, stop).indices(self.get_nrows(name))
+        return self.group[name][start:stop]
+
+    def append(self, name, rows):
+        '''
+        Append rows to streaming dimension 'name'. Rows are collected in
+        memory and written to the file in one go when flushed (see
+        set_flush_policy()); the dataset then grows by at least half its
+        size at a time, so appending is O(rows).
+        '''
+
+        if name not in self._nrows:
+            logging.error("Dimension '%s' is not a streaming dimension" % name)
+            return False
+
+        self._nunflushed += self._buffer_rows(name, rows)
+        self._check_flush()
+        return True
+
+    def _buffer_rows(self, name, rows):
+        '''Add rows to the buffer of 'name', returns their number.'''
+
+        dset = self._datasets[name]
+        rows = np.asarray(rows, dtype=dset.dtype)
+        if rows.ndim == len(dset.shape) - 1:
+            rows = rows.reshape((1, ) + rows.shape)
+        self._buffers[name].append(rows)
+        self._nbuffered[name] += len(rows)
+        return len(rows)
+
+    def add_data_point(self, *args):
+        '''
+        Add data points to the streaming dimensions, like
+        Data.add_data_point(): one value per streaming dimension in the
+        order they were added, or one 1D array per dimension to add several
+        points, or a single 2D array with one column per dimension.
+        '''
+
+        if len(args) == 1 and len(self._streams) > 1:
+            cols = np.asarray(args[0])
+            if cols.ndim == 1:
+                cols = cols.reshape((1, -1))
+            args = cols.T
+
+        if len(args) != len(self._streams):
+            logging.warning('add_data_point(): expected %d columns, got %d' \
+                    % (len(self._streams), len(args)))
+            return False
+
+        for name, val in zip(self._streams, args):
+            npoints = self._buffer_rows(name, val)
+
+        # a data point counts once for the flush policy
+        self._nunflushed += npoints
+        self._check_flush()
+        return True
+
+    def _check_flush(self):
+        rows = self._flush_policy['rows']
+        interval = self._flush_policy['interval']
+        if rows is not None and self._nunflushed >= rows:
+            self.flush()
+        elif interval is not None and \
+                time.time() - self._last_flush >= interval:
+            self.flush()
+
+    def _write_buffers(self):
+        '''Write the buffered rows to the streaming datasets.'''
+
+        for name, buf in self._buffers.iteritems():
+            if len(buf) == 0:
+                continue
+            rows = np.concatenate(buf)
+            self._buffers[name] = []
+            self._nbuffered[name] = 0
+
+            dset = self._datasets[name]
+            n = self._nrows[name]
+            needed = n + len(rows)
+            if needed > len(dset):
+                size = max(needed, len(dset) + len(dset) / 2,
+                        self._STREAM_CHUNK)
+                dset.resize((size, ) + dset.shape[1:])
+            dset[n:needed] = rows
+            self._nrows[name] = needed
+
+    def flush(self):
+        '''
+        Write buffered rows, store the number of rows of the streaming
+        dimensions and flush the file to disk.
+        '''
+
+        self._write_buffers()
+        for name, n in self._nrows.iteritems():
+            self._datasets[name].attrs['nrows'] = n
+        self.h5d.flush()
+        self._nunflushed = 0
+        self._last_flush = time.time()
+
+    def close(self):
+        '''
+        Cut the streaming dimensions to their number of rows and flush.
+        Rows can still be appended afterwards.
+        '''
+
+        self._write_buffers()
+        for name, n in self._nrows.iteritems():
+            dset = self._datasets[name]
+            if len(dset) != n:
+                dset.resize((n, ) + dset.shape[1:])
+        self.flush()
+
     def loop1d_data(self, *args, **kwargs):
         kwargs['group'] = self
         return loop1d_data(*args, **kwargs)
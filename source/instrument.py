@@ -21,6 +21,7 @@ import copy
 import time
 import math
 import inspect
+import threading
 from gettext import gettext as _L
 from lib import calltimer
 from lib.network.object_sharer import SharedGObject, cache_result
@@ -32,6 +33,13 @@ import qt
 from lib.config import get_config
 config = get_config()
 
+# Asynchronous gets / sets and ramps run in a worker thread per lock class
+_worker_pool = calltimer.WorkerPool('instrument')
+_ramp_state = threading.local()
+_ramps = []
+_ramps_lock = threading.Lock()
+_main_thread = threading.currentThread()
+
 class Instrument(SharedGObject):
     """
     Base class for instruments.
@@ -43,6 +51,10 @@ class Instrument(SharedGObject):
     Implement an instrument:
     In __init__ call self.add_variable(<name>, <option dict>)
     Implement _do_get_<variable> and _do_set_<variable> functions
+
+    Optionally implement do_get_many(names, **kwargs) and
+    do_set_many(values, **kwargs) to access several parameters in one
+    transaction, see get() and set().
     """
 
     __gsignals__ = {
@@ -84,8 +96,25 @@ class Instrument(SharedGObject):
     RESERVED_NAMES = ('name', 'type')
 
     _lock_classes = {}
+    _call_locks = {}
 
     def __init__(self, name, **kwargs):
+        '''
+        Input:
+            name (string): name of the instrument
+            kwargs: options of the instrument, stored and available with
+                get_options(). Used by the base class:
+                tags (list of strings): tags of the instrument
+                lockclass (string): name of the bus or connection the
+                    instrument uses, e.g. 'GPIB'. Driver calls of all
+                    instruments with the same lock class are serialized,
+                    also between get_async(), set_async(), ramp() and the
+                    synchronous get() / set(), and share a worker thread.
+                    Defaults to the instrument name, so instruments that
+                    share a bus run concurrently unless they are given the
+                    same lockclass (GPIBInstrument uses 'GPIB').
+        '''
+
         SharedGObject.__init__(self, 'instrument_%s' % name, replace=True)
 
         self._name = name
@@ -100,6 +129,12 @@ class Instrument(SharedGObject):
             self._options['tags'] = []
 
         self._parameters = {}
+        self._getters = {}
+        self._setters = {}
+        self._batch_get = {}
+        self._batch_set = {}
+        self._cache_stats = {}
+        self._ramps = {}
         self._parameter_groups = {}
         self._functions = {}
         self._added_methods = []
@@ -114,6 +149,9 @@ class Instrument(SharedGObject):
         else:
             self._access_lock = calltimer.TimedLock(2.0)
             self._lock_classes[self._lock_class] = self._access_lock
+        if self._lock_class not in Instrument._call_locks:
+            Instrument._call_locks[self._lock_class] = calltimer.CallLock()
+        self._call_lock = Instrument._call_locks[self._lock_class]
 
     def __str__(self):
         return "Instrument '%s'" % (self.get_name())
@@ -255,6 +293,10 @@ class Instrument(SharedGObject):
                     to watch. If any of them changes, execute a get for this
                     parameter. Useful for a parameter that depends on one
                     (or more) other parameters.
+                max_age (float): default maximum age in seconds of the
+                    value of a previous read that a get returns instead of
+                    querying the instrument, see get(). None (default)
+                    always queries.
 
         Output: None
         '''
@@ -308,12 +350,7 @@ class Instrument(SharedGObject):
         base_name = kwargs.get('base_name', name)
 
         if options['flags'] & Instrument.FLAG_GET:
-            if ch is not None:
-                func = lambda query=True, **lopts: \
-                    self.get(name, query=query, channel=ch, **lopts)
-            else:
-                func = lambda query=True, **lopts: \
-                    self.get(name, query=query, **lopts)
+            func = self._make_get_function(name)
 
             self._add_options_to_doc(options)
             func.__doc__ = 'Get variable %s' % name
@@ -337,22 +374,14 @@ class Instrument(SharedGObject):
                 self._get_not_implemented(base_name)
 
         if options['flags'] & Instrument.FLAG_SOFTGET:
-            if ch is not None:
-                func = lambda query=True, **lopts: \
-                    self.get(name, query=False, channel=ch, **lopts)
-            else:
-                func = lambda query=True, **lopts: \
-                    self.get(name, query=False, **lopts)
+            func = self._make_get_function(name, soft=True)
 
             func.__doc__ = 'Get variable %s (internal stored value)' % name
             setattr(self, 'get_%s' % name,  func)
             self._added_methods.append('get_%s' % name)
 
         if options['flags'] & Instrument.FLAG_SET:
-            if ch is not None:
-                func = lambda val, **lopts: self.set(name, val, channel=ch, **lopts)
-            else:
-                func = lambda val, **lopts: self.set(name, val, **lopts)
+            func = self._make_set_function(name)
 
             func.__doc__ = 'Set variable %s' % name
             if 'doc' in options:
@@ -381,6 +410,9 @@ class Instrument(SharedGObject):
             options['value'] = val
         else:
             options['value'] = None
+        options['read_time'] = None
+
+        self._compile_parameter(name)
 
         if 'probe_interval' in options:
             interval = int(options['probe_interval'])
@@ -393,7 +425,7 @@ class Instrument(SharedGObject):
             for (ins, param) in options['listen_to']:
                 inshids.append(ins.connect('changed', \
                         self._listen_parameter_changed_cb,
-                        param, options['get_func']))
+                        param, name))
             options['listed_hids'] = inshids
 
         if 'group' in options:
@@ -416,6 +448,11 @@ class Instrument(SharedGObject):
                 if hasattr(self, fname):
                     delattr(self, fname)
         self._parameters = {}
+        self._getters = {}
+        self._setters = {}
+        self._batch_get = {}
+        self._batch_set = {}
+        self._cache_stats = {}
 
     def remove_parameter(self, name):
         if name not in self._parameters:
@@ -426,6 +463,11 @@ class Instrument(SharedGObject):
                 delattr(self, func)
 
         del self._parameters[name]
+        del self._getters[name]
+        del self._setters[name]
+        self._batch_get.pop(name, None)
+        self._batch_set.pop(name, None)
+        self._cache_stats.pop(name, None)
         self.emit('parameter-removed', name)
 
     def has_parameter(self, name):
@@ -477,6 +519,7 @@ class Instrument(SharedGObject):
 
         for key, val in kwargs.iteritems():
             self._parameters[name][key] = val
+        self._compile_parameter(name)
 
         self.emit('parameter-changed', name)
 
@@ -670,69 +713,27 @@ class Instrument(SharedGObject):
 
         return text
 
-    def _get_value(self, name, query=True, **kwargs):
+    def _get_value(self, name, query=True, max_age=None, **kwargs):
         '''
         Private wrapper function to get a value.
 
         Input:  (1) name of parameter (string)
                 (2) query the instrument or return stored value (Boolean)
-                (3) optional list of extra options
+                (3) maximum age of a stored value to return instead of
+                    querying (seconds)
+                (4) optional list of extra options
         Output: value of parameter (whatever type the instrument driver returns)
         '''
 
         try:
-            p = self._parameters[name]
-        except:
+            getter = self._getters[name]
+        except KeyError:
             print 'Could not retrieve options for parameter %s' % name
             return None
 
-        if 'channel' in p and 'channel' not in kwargs:
-            kwargs['channel'] = p['channel']
-
-        flags = p['flags']
-        if not query or flags & 8: #self.FLAG_SOFTGET:
-            if 'value' in p:
-                if p['type'] == np.ndarray:
-                    return np.array(p['value'])
-                else:
-                    return p['value']
-            else:
-#                logging.debug('Trying to access cached value, but none available')
-                return None
-
-        # Check this here; getting of cached values should work
-        if not flags & 1: #Instrument.FLAG_GET:
-            print 'Instrument does not support getting of %s' % name
-            return None
-
-        if 'base_name' in p:
-            base_name = p['base_name']
-        else:
-            base_name = name
-
-        func = p['get_func']
-        value = func(**kwargs)
-        if 'type' in p and value is not None:
-            try:
-                if p['type'] == types.IntType:
-                    value = int(value)
-                elif p['type'] == types.FloatType:
-                    value = float(value)
-                elif p['type'] == types.StringType:
-                    pass
-                elif p['type'] == types.BooleanType:
-                    value = bool(value)
-                elif p['type'] == types.NoneType:
-                    pass
-                elif p['type'] == np.ndarray:
-                    value = np.array(value)
-            except:
-                logging.warning('Unable to cast value "%s" to %s', value, p['type'])
-
-        p['value'] = value
-        return value
+        return getter(query, kwargs, max_age)
 
-    def get(self, name, query=True, fast=False, **kwargs):
+    def get(self, name, query=True, fast=False, max_age=None, **kwargs):
         '''
         Get one or more Instrument parameter values.
 
@@ -742,43 +743,61 @@ class Instrument(SharedGObject):
                 last stored value
             fast (bool): if True perform as fast as possible, e.g. don't
                 emit a signal to update the GUI.
+            max_age (float): return the stored value instead of querying
+                the instrument if it was read less than max_age seconds
+                ago. Defaults to the max_age option of the parameter, 0
+                always queries. Not used if kwargs are given.
             kwargs: Optional keyword args that will be passed on.
 
         Output: Single value, or dictionary of parameter -> values
                 Type is whatever the instrument driver returns.
-        '''
 
-        if Instrument.USE_ACCESS_LOCK:
-            if not self._access_lock.acquire():
-                logging.warning(_L('Failed to acquire lock!'))
-                return None
+        If a list of parameters is queried and the driver implements
+        do_get_many(names, **kwargs), that function is called once with
+        the names of the parameters that are read from the instrument. It
+        should return a dictionary name -> value; parameters missing from
+        it are read one by one.
+        '''
 
-        if fast:
-            ret = self._get_value(name, query, **kwargs)
+        with self._call_lock:
             if Instrument.USE_ACCESS_LOCK:
-                self._access_lock.release()
-            return ret
-
-        if type(name) in (types.ListType, types.TupleType):
-            changed = {}
-            result = {}
-            for key in name:
-                val = self._get_value(key, query, **kwargs)
-                if val is not None:
-                    result[key] = val
-                    changed[key] = val
+                if not self._access_lock.acquire():
+                    logging.warning(_L('Failed to acquire lock!'))
+                    return None
+
+            if fast:
+                ret = self._get_value(name, query, max_age, **kwargs)
+                if Instrument.USE_ACCESS_LOCK:
+                    self._access_lock.release()
+                return ret
+
+            if type(name) in (types.ListType, types.TupleType):
+                changed = {}
+                result = {}
+                if query:
+                    values = self._get_many(name, kwargs, max_age)
+                else:
+                    values = {}
+                for key in name:
+                    if key in values:
+                        val = values[key]
+                    else:
+                        val = self._get_value(key, query, max_age, **kwargs)
+                    if val is not None:
+                        result[key] = val
+                        changed[key] = val
 
-        else:
-            result = self._get_value(name, query, **kwargs)
-            changed = {name: result}
+            else:
+                result = self._get_value(name, query, max_age, **kwargs)
+                changed = {name: result}
 
-        if Instrument.USE_ACCESS_LOCK:
-            self._access_lock.release()
+            if Instrument.USE_ACCESS_LOCK:
+                self._access_lock.release()
 
-        if len(changed) > 0 and query:
-            self._queue_changed(changed)
+            if len(changed) > 0 and query:
+                self._queue_changed(changed)
 
-        return result
+            return result
 
     def get_threaded(self, *args, **kwargs):
         '''
@@ -789,18 +808,32 @@ class Instrument(SharedGObject):
         if config.get('threading_warning', True):
             logging.warning('Using threading functions could result in QTLab becoming unstable!')
 
-        thread = calltimer.ThreadCall(self.get, *args, **kwargs)
+        return gather(self.get_async(*args, **kwargs))[0]
 
-        # In python 2.6 the function is called is_alive
-        try:
-            isalive = thread.is_alive
-        except:
-            isalive = thread.isAlive
+    def get_async(self, name, query=True, **kwargs):
+        '''
+        Perform get(name, query, **kwargs) in a worker thread and return a
+        calltimer.Future with the result.
+
+        There is a worker thread per lock class (e.g. 'GPIB'), so calls to
+        instruments on the same bus are executed one after another, and
+        calls to instruments on different buses concurrently. Synchronous
+        get() and set() calls on the same bus are not executed at the same
+        time either, see the lockclass option of Instrument. Use gather()
+        to wait for the results.
+        '''
+
+        return _worker_pool.submit(self._lock_class, self.get, name,
+                query=query, **kwargs)
 
-        while isalive():
-            qt.flow.run_mainloop(0.005)
+    def set_async(self, name, value=None, **kwargs):
+        '''
+        Perform set(name, value, **kwargs) in a worker thread and return a
+        calltimer.Future with the result, see get_async().
+        '''
 
-        return thread.get_return_value()
+        return _worker_pool.submit(self._lock_class, self.set, name, value,
+                **kwargs)
 
     def _key_from_format_map_val(self, dic, value):
         for key, val in dic.iteritems():
@@ -888,98 +921,373 @@ class Instrument(SharedGObject):
         Output: Value returned by the _do_set_<name> function,
                 or result of get in FLAG_GET_AFTER_SET specified.
         '''
-        if self._parameters.has_key(name):
-            p = self._parameters[name]
-        else:
-            return None
 
-        if not p['flags'] & Instrument.FLAG_SET:
-            print 'Instrument does not support setting of %s' % name
+        try:
+            setter = self._setters[name]
+        except KeyError:
             return None
 
-        if 'channel' in p and 'channel' not in kwargs:
-            kwargs['channel'] = p['channel']
-
-        # If a format map is available the key should be found.
-        if 'format_map' in p:
-            newval = self._val_from_option_dict(p['format_map'], value)
-            if newval is None:
-                logging.error('Value %s is not a valid option for "%s", valid options: %r',
-                    value, name, repr(p['format_map']))
-                return
-            value = newval
-
-        # If an option list is available check whether the value is in there
-        if 'option_list' in p:
-            newval = self._val_from_option_list(p['option_list'], value)
-            if newval is None:
-                logging.error('Value %s is not a valid option for "%s", valid: %r',
-                    value, name, repr(p['option_list']))
-                return
-            value = newval
-
-        if 'type' in p:
-            try:
-                value = self._convert_value(value, p['type'])
-            except:
+        return setter(value, kwargs)
+
+    _GET_CAST_MAP = {
+            types.IntType: int,
+            types.FloatType: float,
+            types.BooleanType: bool,
+            np.ndarray: np.array,
+    }
+
+    def _compile_parameter(self, name):
+        '''
+        Build the get and set accessors of parameter 'name'. The options are
+        looked up once here instead of on every get / set, so the accessors
+        have to be rebuilt when the options change, which
+        set_parameter_options() does.
+        '''
+
+        p = self._parameters[name]
+        self._cache_stats.setdefault(name, [0, 0])
+        self._getters[name], store, lookup = self._compile_getter(name, p)
+        self._setters[name], check, finish = self._compile_setter(name, p)
+
+        # Accessors used by get() / set() with do_get_many / do_set_many
+        self._batch_get.pop(name, None)
+        self._batch_set.pop(name, None)
+        if store is not None:
+            self._batch_get[name] = (store, lookup)
+        if check is not None:
+            self._batch_set[name] = (check, finish)
+
+    def _compile_getter(self, name, p):
+        '''
+        Return functions (getter(query, kwargs, max_age), store(value),
+        lookup(max_age)) for parameter options p. store() casts and stores
+        a value read from the instrument, lookup() returns whether the
+        stored value can be used instead of a read. store and lookup are
+        None if the parameter is not read from the instrument.
+        '''
+
+        flags = p['flags']
+        soft = bool(flags & self.FLAG_SOFTGET)
+        gettable = bool(flags & self.FLAG_GET)
+        is_array = p['type'] == np.ndarray
+        channel = p.get('channel', None)
+        func = p.get('get_func', None)
+        cast = self._GET_CAST_MAP.get(p['type'], None)
+        ttype = p['type']
+        default_age = p.get('max_age', None)
+        stats = self._cache_stats[name]
+
+        def getter(query, kwargs, max_age=None):
+            if not query or soft:
+                if is_array:
+                    return np.array(p['value'])
+                return p['value']
+
+            # Check this here; getting of cached values should work
+            if not gettable:
+                print 'Instrument does not support getting of %s' % name
                 return None
 
-        if 'minval' in p and value < p['minval']:
-            print 'Trying to set too small value: %s' % value
-            return None
+            if (max_age or default_age) and not kwargs and lookup(max_age):
+                if is_array:
+                    return np.array(p['value'])
+                return p['value']
+
+            if kwargs:
+                if channel is not None and 'channel' not in kwargs:
+                    kwargs['channel'] = channel
+                return store(func(**kwargs))
+            elif channel is not None:
+                return store(func(channel=channel))
+            else:
+                return store(func())
+
+        def store(value):
+            if cast is not None and value is not None:
+                try:
+                    value = cast(value)
+                except:
+                    logging.warning('Unable to cast value "%s" to %s',
+                            value, ttype)
+
+            p['value'] = value
+            p['read_time'] = time.time()
+            return value
 
-        if 'maxval' in p and value > p['maxval']:
-            print 'Trying to set too large value: %s' % value
-            return None
+        def lookup(max_age):
+            if max_age is None:
+                max_age = default_age
+            if not max_age:
+                return False
+            read_time = p['read_time']
+            if read_time is not None and time.time() - read_time <= max_age:
+                stats[0] += 1
+                return True
+            stats[1] += 1
+            return False
 
-        if 'base_name' in p:
-            base_name = p['base_name']
-        else:
-            base_name = name
+        if soft or not gettable:
+            return getter, None, None
+        return getter, store, lookup
+
+    def _compile_setter(self, name, p):
+        '''
+        Return functions (setter(value, kwargs), check(value),
+        finish(value, kwargs)) for parameter options p. check() returns the
+        converted value or None if it is not valid, finish() does the work
+        after the value has been sent to the instrument. check and finish
+        are None if the parameter can not be set in one go.
+        '''
+
+        flags = p['flags']
+        if not flags & self.FLAG_SET:
+            def setter(value, kwargs):
+                print 'Instrument does not support setting of %s' % name
+                return None
+            return setter, None, None
 
+        channel = p.get('channel', None)
         func = p['set_func']
-        if 'maxstep' in p and p['maxstep'] is not None:
-            curval = p['value']
-            if curval is None:
-                logging.warning('Current value not available, ignoring maxstep')
-                curval = value + 0.01 * p['maxstep']
-
-            delta = curval - value
-            if delta < 0:
-                sign = 1
+        format_map = p.get('format_map', None)
+        option_list = p.get('option_list', None)
+        ttype = p.get('type', None)
+        convert = self._CONVERT_MAP.get(ttype, None)
+        has_min = 'minval' in p
+        has_max = 'maxval' in p
+        minval = p.get('minval', None)
+        maxval = p.get('maxval', None)
+        maxstep = p.get('maxstep', None)
+        stepdelay = p.get('stepdelay', 50)
+        get_after_set = bool(flags & self.FLAG_GET_AFTER_SET)
+        persist = bool(flags & self.FLAG_PERSIST)
+        val_from_option_dict = self._val_from_option_dict
+        val_from_option_list = self._val_from_option_list
+
+        def setter(value, kwargs):
+            if channel is not None and 'channel' not in kwargs:
+                kwargs['channel'] = channel
+
+            value = check(value)
+            if value is None:
+                return None
+
+            if maxstep is not None:
+                self._set_stepped(p, func, value, maxstep, stepdelay, kwargs)
             else:
-                sign = -1
+                func(value, **kwargs)
+
+            return finish(value, kwargs)
+
+        def check(value):
+            # If a format map is available the key should be found.
+            if format_map is not None:
+                newval = val_from_option_dict(format_map, value)
+                if newval is None:
+                    logging.error('Value %s is not a valid option for "%s", valid options: %r',
+                        value, name, repr(format_map))
+                    return None
+                value = newval
+
+            # If an option list is available check whether the value is in
+            # there
+            if option_list is not None:
+                newval = val_from_option_list(option_list, value)
+                if newval is None:
+                    logging.error('Value %s is not a valid option for "%s", valid: %r',
+                        value, name, repr(option_list))
+                    return None
+                value = newval
+
+            if ttype is not None:
+                if type(value) is types.BooleanType and \
+                        ttype is not types.BooleanType:
+                    logging.warning('Setting a boolean, but that is not the expected type')
+                    return None
+                if convert is None:
+                    logging.warning('Unsupported type %s', ttype)
+                    return None
+                try:
+                    value = convert(value)
+                except:
+                    logging.warning('Conversion of %r to type %s failed',
+                            value, ttype)
+                    return None
+
+            if has_min and value < minval:
+                print 'Trying to set too small value: %s' % value
+                return None
+
+            if has_max and value > maxval:
+                print 'Trying to set too large value: %s' % value
+                return None
+
+            return value
+
+        def finish(value, kwargs):
+            p['read_time'] = None
+            if get_after_set:
+                value = self._get_value(name, **kwargs)
+
+            if persist:
+                config.set('persist_%s_%s' % (self._name, name), value)
+                config.save()
+
+            p['value'] = value
+            return value
+
+        if maxstep is not None:
+            return setter, None, None
+        return setter, check, finish
+
+    def _get_do_many(self, kind):
+        '''Return the do_<kind>_many function of the driver, if any.'''
+        return getattr(self, 'do_%s_many' % kind,
+                getattr(self, '_do_%s_many' % kind, None))
 
-            if 'stepdelay' in p:
-                delay = p['stepdelay']
+    def _get_many(self, names, kwargs, max_age=None):
+        '''
+        Read parameters 'names' with the do_get_many function of the driver,
+        or take them from the cache if they are recent enough. Returns a
+        dictionary name -> value of the parameters handled; the others
+        should be read one by one.
+        '''
+
+        func = self._get_do_many('get')
+        if func is None:
+            return {}
+
+        ret = {}
+        read = []
+        for key in names:
+            if key not in self._batch_get:
+                continue
+            if not kwargs and self._batch_get[key][1](max_age):
+                ret[key] = self._getters[key](False, {})
             else:
-                delay = 50
+                read.append(key)
+        if len(read) == 0:
+            return ret
 
-            while math.fabs(delta) > 0:
-                if math.fabs(delta) > p['maxstep']:
-                    curval += sign * p['maxstep']
-                    delta += sign * p['maxstep']
-                else:
-                    curval = value
-                    delta = 0
+        values = func(read, **kwargs)
+        for key in read:
+            if key in values:
+                ret[key] = self._batch_get[key][0](values[key])
+            else:
+                ret[key] = self._getters[key](True, dict(kwargs), 0)
+        return ret
+
+    def _set_many(self, values, kwargs):
+        '''
+        Set parameters with the do_set_many function of the driver.
+        Returns a dictionary name -> resulting value (None if the value
+        was not valid) of the parameters handled; the others should be set
+        one by one.
+        '''
+
+        func = self._get_do_many('set')
+        if func is None:
+            return {}
+
+        ret = {}
+        checked = {}
+        for key, val in values.iteritems():
+            if key not in self._batch_set:
+                continue
+            val = self._batch_set[key][0](val)
+            if val is None:
+                ret[key] = None
+            else:
+                checked[key] = val
+        if len(checked) == 0:
+            return ret
+
+        func(checked, **kwargs)
+        for key, val in checked.iteritems():
+            ret[key] = self._batch_set[key][1](val, dict(kwargs))
+        return ret
 
-                ret = func(curval, **kwargs)
+    def _set_stepped(self, p, func, value, maxstep, stepdelay, kwargs):
+        '''
+        Set a parameter to 'value' in steps of at most maxstep, waiting
+        stepdelay ms between steps. In a ramp started with ramp() stepping
+        stops when the ramp is cancelled, see abort_ramps().
+        '''
 
-                if delta != 0:
-                    time.sleep(delay / 1000.0)
+        future = getattr(_ramp_state, 'future', None)
+        curval = p['value']
+        if curval is None:
+            logging.warning('Current value not available, ignoring maxstep')
+            curval = value + 0.01 * maxstep
 
+        delta = curval - value
+        if delta < 0:
+            sign = 1
         else:
-            ret = func(value, **kwargs)
+            sign = -1
 
-        if p['flags'] & self.FLAG_GET_AFTER_SET:
-            value = self._get_value(name, **kwargs)
+        while math.fabs(delta) > 0:
+            if math.fabs(delta) > maxstep:
+                curval += sign * maxstep
+                delta += sign * maxstep
+            else:
+                curval = value
+                delta = 0
+
+            func(curval, **kwargs)
+
+            if delta != 0:
+                if future is not None:
+                    # Let other calls on the bus through between steps
+                    self._call_lock.release()
+                    try:
+                        time.sleep(stepdelay / 1000.0)
+                    finally:
+                        self._call_lock.acquire()
+                else:
+                    time.sleep(stepdelay / 1000.0)
+                if future is not None and future.cancelled():
+                    p['value'] = curval
+                    raise calltimer.CancelledError('Ramp stopped at %s' % \
+                            curval)
 
-        if p['flags'] & self.FLAG_PERSIST:
-            config.set('persist_%s_%s' % (self._name, name), value)
-            config.save()
+    def _make_get_function(self, name, soft=False):
+        '''
+        Return the get_<name> function, which calls the compiled getter
+        directly and is equivalent to get(name, ...).
+        '''
 
-        p['value'] = value
-        return value
+        def func(query=True, fast=False, max_age=None, **kwargs):
+            if Instrument.USE_ACCESS_LOCK:
+                return self.get(name, query=query and not soft, fast=fast,
+                        max_age=max_age, **kwargs)
+            if soft:
+                query = False
+            with self._call_lock:
+                value = self._getters[name](query, kwargs, max_age)
+            if query and not fast:
+                self._queue_changed({name: value})
+            return value
+
+        return func
+
+    def _make_set_function(self, name):
+        '''
+        Return the set_<name> function, which calls the compiled setter
+        directly and is equivalent to set(name, val, ...).
+        '''
+
+        def func(val, fast=False, **kwargs):
+            if self._locked or Instrument.USE_ACCESS_LOCK or self._ramps:
+                return self.set(name, val, fast=fast, **kwargs)
+            with self._call_lock:
+                value = self._setters[name](val, kwargs)
+            if value is None:
+                return False
+            if not fast:
+                self._queue_changed({name: value})
+            return True
+
+        return func
 
     def set(self, name, value=None, fast=False, **kwargs):
         '''
@@ -998,6 +1306,12 @@ class Instrument(SharedGObject):
 
         Output: True or False whether the operation succeeded.
                 For multiple sets return False if any of the parameters failed.
+
+        If a dictionary is given and the driver implements
+        do_set_many(values, **kwargs), that function is called once with a
+        dictionary name -> value of the checked and converted values. It
+        should set all of them. Parameters with a maxstep are set one by
+        one.
         '''
 
         if self._locked:
@@ -1005,35 +1319,148 @@ class Instrument(SharedGObject):
                     self.get_name())
             return False
 
-        if Instrument.USE_ACCESS_LOCK:
-            if not self._access_lock.acquire():
-                logging.warning(_L('Failed to acquire lock!'))
-                return None
+        if self._ramps:
+            if type(name) == types.DictType:
+                self._wait_ramps(name.keys())
+            else:
+                self._wait_ramps([name])
+
+        with self._call_lock:
+            if Instrument.USE_ACCESS_LOCK:
+                if not self._access_lock.acquire():
+                    logging.warning(_L('Failed to acquire lock!'))
+                    return None
 
-        result = True
-        changed = {}
-        if type(name) == types.DictType:
-            for key, val in name.iteritems():
-                val = self._set_value(key, val, **kwargs)
+            result = True
+            changed = {}
+            if type(name) == types.DictType:
+                values = self._set_many(name, kwargs)
+                for key, val in name.iteritems():
+                    if key in values:
+                        val = values[key]
+                    else:
+                        val = self._set_value(key, val, **kwargs)
+                    if val is not None:
+                        changed[key] = val
+                    else:
+                        result = False
+
+            else:
+                val = self._set_value(name, value, **kwargs)
                 if val is not None:
-                    changed[key] = val
+                    changed[name] = val
                 else:
                     result = False
 
+            if Instrument.USE_ACCESS_LOCK:
+                self._access_lock.release()
+
+            if not fast and len(changed) > 0:
+                self._queue_changed(changed)
+
+            return result
+
+    def ramp(self, name, value, **kwargs):
+        '''
+        Set parameter 'name' to 'value' without waiting for it to finish.
+        Parameters with a maxstep are ramped with the same steps and delays
+        as with set().
+
+        Ramps run in a worker thread per lock class (e.g. 'GPIB'), so ramps
+        of instruments on different buses run concurrently and ramps on the
+        same bus one after another. Other calls to instruments on the same
+        bus, e.g. a get(), are executed between the steps of a ramp. A set()
+        of a parameter that is being ramped waits for the ramp to finish.
+
+        Input:
+            name (string): parameter to set
+            value (any): the value to set
+            kwargs: Optional keyword args that will be passed on.
+
+        Output: calltimer.Future, with as result True or False whether
+            setting succeeded. Use wait_ramps() to wait for all ramps and
+            abort_ramps() to stop them.
+        '''
+
+        future = calltimer.Future()
+        if self._locked:
+            logging.warning('Trying to set value of locked instrument (%s)',
+                    self.get_name())
+            future.set_result(False)
+            return future
+
+        self._ramps[name] = future
+        _ramps_lock.acquire()
+        _ramps.append(future)
+        _ramps_lock.release()
+        future.add_done_callback(lambda f: self._ramp_done(name, f))
+
+        _worker_pool.put(self._lock_class, future, self._run_ramp,
+                (future, name, value, kwargs))
+        return future
+
+    def _run_ramp(self, future, name, value, kwargs):
+        _ramp_state.future = future
+        try:
+            with self._call_lock:
+                val = self._set_value(name, value, **kwargs)
+        finally:
+            _ramp_state.future = None
+
+        if val is None:
+            return False
+        self._queue_changed({name: val})
+        return True
+
+    def _ramp_done(self, name, future):
+        if self._ramps.get(name) is future:
+            del self._ramps[name]
+        _ramps_lock.acquire()
+        _ramps.remove(future)
+        _ramps_lock.release()
+
+        e = future.exception()
+        if isinstance(e, calltimer.CancelledError):
+            logging.warning('Ramp of %s.%s cancelled: %s', self._name, name, e)
+        elif e is not None:
+            logging.warning('Ramp of %s.%s failed: %s', self._name, name, e)
+
+    def _wait_ramps(self, names):
+        '''Wait for the ramps of parameters 'names'.'''
+        futures = [self._ramps[name] for name in names if name in self._ramps]
+        wait_futures(futures)
+
+    def invalidate_cache(self, name=None):
+        '''
+        Make the next get of parameter 'name' (or all parameters if None)
+        query the instrument, whatever max_age is.
+        '''
+
+        if name is None:
+            names = self._parameters.keys()
         else:
-            val = self._set_value(name, value, **kwargs)
-            if val is not None:
-                changed[name] = val
-            else:
-                result = False
+            names = [name]
+        for key in names:
+            if key in self._parameters:
+                self._parameters[key]['read_time'] = None
 
-        if Instrument.USE_ACCESS_LOCK:
-            self._access_lock.release()
+    def get_cache_stats(self):
+        '''
+        Return a dictionary parameter -> (hits, misses) with the number of
+        gets that returned a cached value and that had to query the
+        instrument because the cached value was too old. Only gets with a
+        max_age are counted.
+        '''
 
-        if not fast and len(changed) > 0:
-            self._queue_changed(changed)
+        ret = {}
+        for name, (hits, misses) in self._cache_stats.iteritems():
+            ret[name] = (hits, misses)
+        return ret
 
-        return result
+    def reset_cache_stats(self):
+        for stats in self._cache_stats.itervalues():
+            stats[0] = 0
+            stats[1] = 0
 
     def update_value(self, name, value):
         '''
@@ -1180,12 +1607,17 @@ class Instrument(SharedGObject):
             (Instrument.get_type(self), name))
 
     def _listen_parameter_changed_cb(self, sender, changed, \
-            listen_param, update_func):
+            listen_param, name):
 
         if listen_param not in changed:
             return
 
-        update_func()
+        # Read the new value without emitting 'changed', so parameters
+        # listening to each other do not trigger each other forever.
+        self.invalidate_cache(name)
+        if name in self._batch_get:
+            with self._call_lock:
+                self._getters[name](True, {}, 0)
 
     def _do_emit_changed(self):
         # was this a bug?
@@ -1194,10 +1626,101 @@ class Instrument(SharedGObject):
         self._changed_hid = None
 
     def _queue_changed(self, changed):
+        # Signals are emitted by the main loop, worker threads hand the
+        # changes over to it.
+        if threading.currentThread() is not _main_thread:
+            gobject.idle_add(self._queue_changed, changed)
+            return
+
         self._changed.update(changed)
         if self._changed_hid is None:
             self._changed_hid = gobject.idle_add(self._do_emit_changed)
 
+def wait_ramps(timeout=None):
+    '''
+    Wait until all ramps started with Instrument.ramp() have finished,
+    handling events like qt.msleep() meanwhile. If the measurement is
+    aborted the ramps are stopped with abort_ramps().
+
+    Input:
+        timeout (float): maximum time to wait in seconds, None for no limit
+    Output: True if all ramps have finished, False on timeout
+    '''
+
+    start = time.time()
+    try:
+        while True:
+            _ramps_lock.acquire()
+            pending = len(_ramps)
+            _ramps_lock.release()
+            if pending == 0:
+                return True
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            qt.msleep(0.01)
+    except:
+        abort_ramps()
+        raise
+
+def gather(*futures, **kwargs):
+    '''
+    Wait for futures, e.g. from Instrument.get_async(), and return their
+    results. Events are handled while waiting.
+
+    Input:
+        futures: calltimer.Future objects, or one list of them
+        timeout (float): maximum time to wait in seconds, None (default)
+            for no limit
+    Output: list with the results, in the order of the futures. If a call
+        raised an exception it is raised here.
+    '''
+
+    timeout = kwargs.get('timeout', None)
+    if len(futures) == 1 and type(futures[0]) in (types.ListType,
+            types.TupleType):
+        futures = futures[0]
+
+    start = time.time()
+    for future in futures:
+        while not future.wait(0.005):
+            qt.flow.run_mainloop(0, wait=False)
+            if timeout is not None and time.time() - start > timeout:
+                raise RuntimeError('Timeout waiting for result')
+
+    return [future.result() for future in futures]
+
+def wait_futures(futures):
+    '''
+    Wait until calltimer.Future objects have finished. In the main thread
+    events are handled meanwhile like qt.msleep(); if the measurement is
+    aborted the futures are cancelled.
+    '''
+
+    if threading.currentThread() is not _main_thread:
+        calltimer.wait_futures(futures)
+        return
+
+    try:
+        for future in futures:
+            while not future.done():
+                qt.msleep(0.01)
+    except:
+        for future in futures:
+            future.cancel()
+        raise
+
+def abort_ramps():
+    '''
+    Stop all ramps started with Instrument.ramp(). Running ramps stop after
+    the current step; the parameter keeps the value of that step.
+    '''
+
+    _ramps_lock.acquire()
+    futures = list(_ramps)
+    _ramps_lock.release()
+    for future in futures:
+        future.cancel()
+
 class InvalidInstrument(Instrument):
     '''
     Placeholder class for instruments that fail to load, mainly to support
@@ -22,7 +22,9 @@ import gobject
 import gtk
 #gtk.gdk.threads_init()
 
+import thread
 import threading
+import Queue
 import time
 from misc import exact_time
 
@@ -64,6 +66,40 @@ class TimedLock():
     def release(self):
         self._lock.release()
 
+class CallLock(object):
+    '''
+    Reentrant lock, which can also be used in a with statement. Cheaper
+    than threading.RLock, which is implemented in python.
+    '''
+
+    __slots__ = ('_lock', '_owner', '_count')
+
+    def __init__(self):
+        self._lock = thread.allocate_lock()
+        self._owner = None
+        self._count = 0
+
+    def acquire(self):
+        me = thread.get_ident()
+        if self._owner == me:
+            self._count += 1
+            return True
+        self._lock.acquire()
+        self._owner = me
+        self._count = 1
+        return True
+
+    def release(self):
+        self._count -= 1
+        if self._count == 0:
+            self._owner = None
+            self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *args):
+        self.release()
+
 class ThreadVariable():
     def __init__(self, value=None):
         self._value = value
@@ -233,3 +269,190 @@ class ThreadCall(threading.Thread):
 
     def get_return_value(self):
         return self._return_value
+
+class CancelledError(Exception):
+    pass
+
+class Future():
+    '''
+    Result of a call that is executed in another thread, e.g. by a
+    WorkerThread. The thread sets the result with set_result() or
+    set_exception(); result() waits for it.
+
+    cancel() requests the call to stop: a call that has not started yet is
+    skipped, a running call can check cancelled() and stop early.
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exception = None
+        self._cancelled = False
+        self._callbacks = []
+
+    def cancel(self):
+        '''Request the call to stop, returns False if it already finished.'''
+        if self.done():
+            return False
+        self._cancelled = True
+        return True
+
+    def cancelled(self):
+        return self._cancelled
+
+    def done(self):
+        return self._event.isSet()
+
+    def wait(self, timeout=None):
+        '''Wait until the call has finished, returns False on timeout.'''
+        self._event.wait(timeout)
+        return self._event.isSet()
+
+    def result(self, timeout=None):
+        '''
+        Wait until the call has finished and return its return value, or
+        raise the exception it raised.
+        '''
+
+        if not self.wait(timeout):
+            raise RuntimeError('Timeout waiting for result')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        '''Wait until the call has finished and return its exception.'''
+        if not self.wait(timeout):
+            raise RuntimeError('Timeout waiting for result')
+        return self._exception
+
+    def add_done_callback(self, func):
+        '''
+        Call func(future) when the call has finished, in the thread that
+        finishes it, or directly if it has finished already.
+        '''
+
+        self._lock.acquire()
+        if not self._event.isSet():
+            self._callbacks.append(func)
+            self._lock.release()
+            return
+        self._lock.release()
+        func(self)
+
+    def set_result(self, value):
+        self._result = value
+        self._finish()
+
+    def set_exception(self, e):
+        self._exception = e
+        self._finish()
+
+    def _finish(self):
+        self._lock.acquire()
+        self._event.set()
+        callbacks = self._callbacks
+        self._callbacks = []
+        self._lock.release()
+
+        for func in callbacks:
+            try:
+                func(self)
+            except Exception, e:
+                logging.warning('Error in future callback: %s', e)
+
+def wait_futures(futures, timeout=None):
+    '''
+    Wait until all futures have finished, returns False on timeout.
+    '''
+
+    if timeout is not None:
+        end = time.time() + timeout
+    for future in futures:
+        if timeout is None:
+            future.wait()
+        elif not future.wait(max(0, end - time.time())):
+            return False
+    return True
+
+class WorkerThread(threading.Thread):
+    '''
+    Execute calls one after another in a separate thread. Every call gets
+    a Future with its result.
+    '''
+
+    def __init__(self, name=None):
+        threading.Thread.__init__(self, name=name)
+        self.setDaemon(True)
+        self._queue = Queue.Queue()
+        self.start()
+
+    def put(self, future, func, args=(), kwargs={}):
+        '''Queue func(*args, **kwargs), the result is set in future.'''
+        self._queue.put((future, func, args, kwargs))
+
+    def submit(self, func, *args, **kwargs):
+        '''Queue func(*args, **kwargs), returns a Future.'''
+        future = Future()
+        self.put(future, func, args, kwargs)
+        return future
+
+    def get_queue_length(self):
+        return self._queue.qsize()
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            future, func, args, kwargs = item
+            if future.cancelled():
+                future.set_exception(CancelledError('Call cancelled'))
+                continue
+
+            try:
+                ret = func(*args, **kwargs)
+            except Exception, e:
+                future.set_exception(e)
+            else:
+                future.set_result(ret)
+
+    def stop(self):
+        '''Stop the thread after the queued calls.'''
+        self._queue.put(None)
+
+class WorkerPool():
+    '''
+    WorkerThreads by key, created when first used. Calls with the same key
+    are executed one after another, calls with different keys concurrently.
+    '''
+
+    def __init__(self, name='worker'):
+        self._name = name
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def get_worker(self, key):
+        self._lock.acquire()
+        try:
+            if key not in self._workers:
+                self._workers[key] = WorkerThread('%s-%s' % (self._name, key))
+            return self._workers[key]
+        finally:
+            self._lock.release()
+
+    def put(self, key, future, func, args=(), kwargs={}):
+        self.get_worker(key).put(future, func, args, kwargs)
+
+    def submit(self, key, func, *args, **kwargs):
+        '''Queue func(*args, **kwargs) for worker 'key', returns a Future.'''
+        return self.get_worker(key).submit(func, *args, **kwargs)
+
+    def stop(self):
+        self._lock.acquire()
+        for worker in self._workers.values():
+            worker.stop()
+        self._workers = {}
+        self._lock.release()
@@ -0,0 +1,152 @@
+# datacache.py, binary sidecar cache for parsed data files
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Cache for parsed data files.
+
+The parsed array of a data file is stored in a .npy sidecar, together with
+an info file containing the parsed header information and the path, size
+and modification time of the data file. Loading the cache memory-maps the
+array, so a cached file opens almost instantly and the pages are shared
+between processes. An entry is discarded when the data file has changed.
+
+Sidecars are placed next to the data file, or in 'cachedir' (named after
+a hash of the data file path) if that is specified.
+'''
+
+import os
+import hashlib
+import logging
+import numpy
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+_VERSION = 1
+
+def get_cache_filepaths(filepath, cachedir=None):
+    '''Return the paths of the array and info sidecars for filepath.'''
+
+    if cachedir:
+        key = hashlib.md5(os.path.abspath(filepath)).hexdigest()
+        base = os.path.join(cachedir, key)
+    else:
+        base = filepath
+    return base + '.cache.npy', base + '.cache.info'
+
+def get_file_key(filepath):
+    '''Return the properties that identify the current version of a file.'''
+
+    st = os.stat(filepath)
+    return {
+        'version': _VERSION,
+        'path': os.path.abspath(filepath),
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+    }
+
+def load(filepath, cachedir=None):
+    '''
+    Load the cached version of filepath.
+
+    Output:
+        (info, data) tuple, with data a copy-on-write memory map, or None if
+        there is no valid cache entry. Stale entries are removed.
+    '''
+
+    npyfn, infofn = get_cache_filepaths(filepath, cachedir)
+    if not os.path.exists(infofn) or not os.path.exists(npyfn):
+        return None
+
+    try:
+        f = open(infofn, 'rb')
+        try:
+            info = pickle.load(f)
+        finally:
+            f.close()
+    except Exception, e:
+        logging.warning('Unable to read cache info %s: %s', infofn, e)
+        invalidate(filepath, cachedir)
+        return None
+
+    try:
+        key = get_file_key(filepath)
+    except OSError:
+        return None
+
+    if info.get('key', None) != key:
+        logging.debug('Cache for %s is stale, removing', filepath)
+        invalidate(filepath, cachedir)
+        return None
+
+    try:
+        data = numpy.load(npyfn, mmap_mode='c')
+    except Exception, e:
+        logging.warning('Unable to load cached data %s: %s', npyfn, e)
+        invalidate(filepath, cachedir)
+        return None
+
+    return info, data
+
+def save(filepath, key, info, data, cachedir=None):
+    '''
+    Store parsed data of filepath in the cache.
+
+    Input:
+        filepath (string): path of the data file
+        key (dict): file key from get_file_key(), taken before parsing
+        info (dict): picklable header information
+        data (numpy.array): the parsed data
+
+    Output:
+        True if the cache entry was written
+    '''
+
+    npyfn, infofn = get_cache_filepaths(filepath, cachedir)
+    info = dict(info)
+    info['key'] = key
+
+    try:
+        if cachedir and not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+        # The info file marks a valid entry, so write it last
+        invalidate(filepath, cachedir)
+        numpy.save(npyfn, numpy.asarray(data))
+        tmpfn = infofn + '.tmp'
+        f = open(tmpfn, 'wb')
+        try:
+            pickle.dump(info, f, pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmpfn, infofn)
+    except Exception, e:
+        logging.debug('Unable to write cache for %s: %s', filepath, e)
+        invalidate(filepath, cachedir)
+        return False
+
+    return True
+
+def invalidate(filepath, cachedir=None):
+    '''Remove the cache entry for filepath.'''
+
+    for fn in get_cache_filepaths(filepath, cachedir):
+        try:
+            if os.path.exists(fn):
+                os.remove(fn)
+        except OSError, e:
+            logging.warning('Unable to remove cache file %s: %s', fn, e)
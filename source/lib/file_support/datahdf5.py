@@ -0,0 +1,265 @@
+# datahdf5.py, HDF5 storage of data files
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+HDF5 storage for the 'hdf5' backend of Data.
+
+A data file contains:
+    /data       2D dataset with one row per data point, chunked, resizable
+                and optionally gzip compressed. Attributes: 'header' (the
+                text header of the data file, parsed as for text files),
+                'column_names' and 'column_types'.
+    /blocks     1D int64 dataset with the row numbers at which blocks end
+    /comments   1D uint8 dataset with the comments as newline-terminated
+                text (variable length strings can not be appended to
+                safely in SWMR mode)
+    /settings   group with a subgroup per instrument holding the parameter
+                values as attributes (instrument settings snapshot)
+
+The file is written in SWMR (single writer, multiple reader) mode, so other
+processes can open it with swmr=True and read the rows flushed so far
+without locking; the datasets only grow and are always consistent.
+
+h5py is imported when available; without it the backend can not be used.
+'''
+
+import time
+import logging
+import numpy
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+_MAGIC = '\x89HDF\r\n\x1a\n'
+
+def is_available():
+    return h5py is not None
+
+def is_hdf5_file(filepath):
+    '''Return whether filepath is an HDF5 file.'''
+    try:
+        f = open(filepath, 'rb')
+        try:
+            return f.read(len(_MAGIC)) == _MAGIC
+        finally:
+            f.close()
+    except IOError:
+        return False
+
+def _open(filepath):
+    return h5py.File(filepath, 'r', libver='latest', swmr=True)
+
+class HDF5Writer():
+    '''
+    Write the rows, block ends and comments of a Data object to an HDF5
+    file, see module documentation.
+
+    Rows are collected in memory and appended to the data set when one of
+    the limits of the flush policy (as for datawriter.BufferedWriter) is
+    reached:
+        rows: number of buffered rows
+        nbytes: number of buffered bytes
+        interval: time in seconds since the last flush
+    '''
+
+    def __init__(self, filepath, ncols, header='', names=(), types=(),
+            comments=(), settings=(), compresslevel=4, chunkrows=4096,
+            rows=None, nbytes=None, interval=None):
+        if h5py is None:
+            raise ImportError('h5py is required for the hdf5 backend')
+
+        self._file = h5py.File(filepath, 'w', libver='latest')
+        if compresslevel:
+            compress = {'compression': 'gzip',
+                    'compression_opts': compresslevel}
+        else:
+            compress = {}
+
+        self._data = self._file.create_dataset('data', shape=(0, ncols),
+                maxshape=(None, ncols), dtype=numpy.float64,
+                chunks=(chunkrows, ncols), **compress)
+        self._data.attrs['header'] = header
+        self._data.attrs['column_names'] = [str(n) for n in names]
+        self._data.attrs['column_types'] = [str(t) for t in types]
+        self._blocks = self._file.create_dataset('blocks', shape=(0, ),
+                maxshape=(None, ), dtype=numpy.int64, chunks=(1024, ))
+        self._comments = self._file.create_dataset('comments',
+                shape=(0, ), maxshape=(None, ), dtype=numpy.uint8,
+                chunks=(4096, ))
+        for comment in comments:
+            self.add_comment(comment)
+
+        group = self._file.create_group('settings')
+        for insname, params in settings:
+            insgroup = group.create_group(insname)
+            for param, val in params:
+                if not isinstance(val, (int, long, float, bool, str)):
+                    val = str(val)
+                insgroup.attrs[param] = val
+
+        # No objects can be created from here on
+        self._file.swmr_mode = True
+
+        self._buffer = []
+        self._buffer_rows = 0
+        self._buffer_bytes = 0
+        self._nrows = 0
+        self._last_flush = time.time()
+        self.set_policy(rows=rows, nbytes=nbytes, interval=interval)
+
+    def set_policy(self, rows=None, nbytes=None, interval=None):
+        '''Set the flush policy, see the class documentation.'''
+        self._rows = rows
+        self._nbytes = nbytes
+        self._interval = interval
+
+    def get_policy(self):
+        return {
+            'rows': self._rows,
+            'nbytes': self._nbytes,
+            'interval': self._interval,
+        }
+
+    def get_file(self):
+        '''Return the h5py.File.'''
+        return self._file
+
+    def get_thread(self):
+        return None
+
+    def get_position(self):
+        '''Return the number of rows written, including buffered ones.'''
+        return self._nrows + self._buffer_rows
+
+    def _append(self, dset, values):
+        n = len(dset)
+        dset.resize((n + len(values), ) + dset.shape[1:])
+        dset[n:] = values
+
+    def write_rows(self, rows):
+        '''Add a 2D array of rows and flush if required by the policy.'''
+
+        rows = numpy.asarray(rows, dtype=numpy.float64)
+        self._buffer.append(rows)
+        self._buffer_rows += len(rows)
+        self._buffer_bytes += rows.nbytes
+
+        if self._rows is not None and self._buffer_rows >= self._rows:
+            self.flush()
+        elif self._nbytes is not None and self._buffer_bytes >= self._nbytes:
+            self.flush()
+        elif self._interval is not None and \
+                time.time() - self._last_flush >= self._interval:
+            self.flush()
+
+    def add_block(self, row):
+        '''Mark the end of a block before row 'row'.'''
+        self.flush()
+        self._append(self._blocks, [row])
+        self._blocks.flush()
+
+    def add_comment(self, comment):
+        text = str(comment).replace('\n', ' ') + '\n'
+        self._append(self._comments, numpy.fromstring(text, numpy.uint8))
+        self._comments.flush()
+
+    def flush(self):
+        '''Append the buffered rows and make them visible to readers.'''
+
+        self._last_flush = time.time()
+        if len(self._buffer) == 0:
+            return
+
+        rows = numpy.concatenate(self._buffer)
+        self._buffer = []
+        self._buffer_rows = 0
+        self._buffer_bytes = 0
+
+        self._append(self._data, rows)
+        self._nrows += len(rows)
+        self._data.flush()
+
+    def sync(self):
+        self.flush()
+
+    def close(self):
+        '''Flush the buffer; the file itself is not closed.'''
+        self.flush()
+        return True
+
+def read_file(filepath, data=True):
+    '''
+    Read an HDF5 data file, with data=False only the header information.
+
+    Output:
+        dictionary with 'header' (text header), 'comments', 'ends' (block
+        ends) and 'data' (2D numpy.array), or None on failure.
+    '''
+
+    try:
+        f = _open(filepath)
+    except Exception, e:
+        logging.warning('Unable to open HDF5 file %s: %s', filepath, e)
+        return None
+
+    try:
+        dset = f['data']
+        ret = {
+            'header': str(dset.attrs.get('header', '')),
+            'ncols': dset.shape[1],
+            'comments': f['comments'][:].tostring().split('\n')[:-1],
+            'ends': [int(e) for e in f['blocks'][:]],
+        }
+        if data:
+            ret['data'] = dset[:]
+            ret['ends'] = [e for e in ret['ends'] if e <= len(ret['data'])]
+        return ret
+    finally:
+        f.close()
+
+def iter_rows(filepath, nrows):
+    '''
+    Generate (rows, ends) tuples with up to nrows rows of an HDF5 data file,
+    with 'ends' the block ends in or directly after 'rows'.
+    '''
+
+    f = _open(filepath)
+    try:
+        dset = f['data']
+        total = len(dset)
+        ends = [int(e) for e in f['blocks'][:]]
+        for start in xrange(0, total, nrows):
+            stop = min(start + nrows, total)
+            yield dset[start:stop], [e for e in ends if start < e <= stop]
+    finally:
+        f.close()
+
+def get_settings(filepath):
+    '''
+    Return the instrument settings snapshot of an HDF5 data file as a
+    dictionary {instrument: {parameter: value}}.
+    '''
+
+    f = _open(filepath)
+    try:
+        ret = {}
+        for insname, group in f['settings'].iteritems():
+            ret[insname] = dict(group.attrs)
+        return ret
+    finally:
+        f.close()
@@ -0,0 +1,266 @@
+# dataindex.py, byte offset index of text data files
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Index of byte offsets in text data files.
+
+The index lists for every block the number of the first row in the block
+and the byte offset at which it starts, plus the same for every Kth row
+(the row step). With it a range of blocks or rows can be read from a large
+data file without parsing everything before it.
+
+The index is kept in a sidecar <datafile>.idx, a text file that is
+appended to while the data file is written. New entries are kept until
+flush() writes them, which should happen only after the data they point
+at is in the data file:
+    QTLIDX1 <rowstep>
+    b <row> <offset>        start of a block
+    r <row> <offset>        start of a row
+Repeated blank lines end a block only once: a block entry with the same
+first row as the previous one replaces it.
+For files without a sidecar the index is built by scanning the file once.
+'''
+
+import os
+import bisect
+import logging
+import threading
+
+_MAGIC = 'QTLIDX1'
+
+def get_index_filepath(filepath):
+    '''Return the path of the index sidecar of filepath.'''
+    return filepath + '.idx'
+
+def _is_data_line(line):
+    return len(line.split('#', 1)[0].split()) > 0
+
+class BlockIndex():
+    '''
+    Block and row offsets of a text data file, see module documentation.
+    '''
+
+    def __init__(self, filepath, rowstep=1024):
+        self._filepath = filepath
+        self._rowstep = rowstep
+        self._blocks = []
+        self._rows = []
+        self._nrows = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._unwritten = []
+        self._nentries = 0
+
+    def get_rowstep(self):
+        return self._rowstep
+
+    def create(self):
+        '''Start a new sidecar, entries added later are appended to it.'''
+        self._blocks = []
+        self._rows = []
+        self._unwritten = []
+        self._nentries = 0
+        self._file = open(get_index_filepath(self._filepath), 'w')
+        self._file.write('%s %d\n' % (_MAGIC, self._rowstep))
+
+    def add_block(self, row, offset):
+        '''Add a block starting with row 'row' at byte 'offset'.'''
+        self._add_block(self._blocks, row, offset)
+        if self._file is not None:
+            self._queue_entry('b %d %d\n' % (row, offset))
+
+    def _add_block(self, blocks, row, offset):
+        if len(blocks) > 0 and blocks[-1][0] == row:
+            blocks[-1] = (row, offset)
+        else:
+            blocks.append((row, offset))
+
+    def add_row(self, row, offset):
+        '''Add row 'row' starting at byte 'offset'.'''
+        self._rows.append((row, offset))
+        if self._file is not None:
+            self._queue_entry('r %d %d\n' % (row, offset))
+
+    def _queue_entry(self, line):
+        self._lock.acquire()
+        self._unwritten.append(line)
+        self._nentries += 1
+        self._lock.release()
+
+    def get_nentries(self):
+        '''Return the number of entries added to the sidecar so far.'''
+        return self._nentries
+
+    def flush(self, nentries=None):
+        '''
+        Write the entries not written yet to the sidecar, or only those up
+        to entry number 'nentries' (see get_nentries()). Can be called from
+        another thread than the one adding entries.
+        '''
+
+        self._lock.acquire()
+        try:
+            n = len(self._unwritten)
+            if nentries is not None:
+                n = max(0, n - (self._nentries - nentries))
+            lines = self._unwritten[:n]
+            del self._unwritten[:n]
+            if self._file is not None:
+                self._file.write(''.join(lines))
+                self._file.flush()
+        finally:
+            self._lock.release()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def load(self):
+        '''Read the sidecar, returns False if there is no valid one.'''
+
+        fn = get_index_filepath(self._filepath)
+        if not os.path.exists(fn):
+            return False
+
+        blocks, rows = [], []
+        try:
+            f = open(fn, 'r')
+            try:
+                magic, rowstep = f.readline().split()
+                if magic != _MAGIC:
+                    return False
+                for line in f:
+                    # Skip an entry that is still being written
+                    if not line.endswith('\n'):
+                        break
+                    kind, row, offset = line.split()
+                    if kind == 'b':
+                        self._add_block(blocks, int(row), int(offset))
+                    elif kind == 'r':
+                        rows.append((int(row), int(offset)))
+            finally:
+                f.close()
+        except (IOError, ValueError), e:
+            logging.warning('Unable to read index %s: %s', fn, e)
+            return False
+
+        self._rowstep = int(rowstep)
+        self._blocks = blocks
+        self._rows = rows
+        return True
+
+    def save(self):
+        '''Write the complete index to the sidecar.'''
+
+        fn = get_index_filepath(self._filepath)
+        tmpfn = fn + '.tmp'
+        try:
+            f = open(tmpfn, 'w')
+            try:
+                f.write('%s %d\n' % (_MAGIC, self._rowstep))
+                entries = [(o, r, 'b') for r, o in self._blocks] + \
+                        [(o, r, 'r') for r, o in self._rows]
+                entries.sort()
+                for offset, row, kind in entries:
+                    f.write('%s %d %d\n' % (kind, row, offset))
+            finally:
+                f.close()
+            os.rename(tmpfn, fn)
+        except (IOError, OSError), e:
+            logging.debug('Unable to write index %s: %s', fn, e)
+            return False
+        return True
+
+    def update(self):
+        '''
+        Scan the data file from the last indexed position to the end and
+        add the blocks and rows found. Only complete lines are indexed.
+        '''
+
+        last = (0, 0)
+        if len(self._blocks) > 0:
+            last = max(last, self._blocks[-1][::-1])
+        if len(self._rows) > 0:
+            last = max(last, self._rows[-1][::-1])
+        offset, row = last
+        seen_data = len(self._blocks) > 0
+
+        f = open(self._filepath, 'rb')
+        try:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+
+                if _is_data_line(line):
+                    if not seen_data:
+                        self._blocks.append((row, offset))
+                        seen_data = True
+                    elif row % self._rowstep == 0 and row > 0 and \
+                            offset > last[0]:
+                        self._rows.append((row, offset))
+                    row += 1
+                elif seen_data and row > 0 and \
+                        len(line.strip(' \t\r\n')) == 0:
+                    self._add_block(self._blocks, row, offset + len(line))
+
+                offset += len(line)
+        finally:
+            f.close()
+
+        self._nrows = row
+
+    def get_nrows(self):
+        '''Return the number of rows found by the last update().'''
+        return self._nrows
+
+    def get_nblocks(self):
+        return len(self._blocks)
+
+    def get_block(self, blockid):
+        '''Return (first row, byte offset) of block blockid.'''
+        return self._blocks[blockid]
+
+    def get_row(self, row):
+        '''
+        Return (row, byte offset) of the last indexed row at or before
+        'row', which can be a block start.
+        '''
+
+        entries = self._get_entries()
+        i = bisect.bisect_right(entries, (row, float('inf'))) - 1
+        if i < 0:
+            return None
+        return entries[i]
+
+    def get_row_after(self, row):
+        '''
+        Return (row, byte offset) of the first indexed row at or after
+        'row', or None if there is none.
+        '''
+
+        entries = self._get_entries()
+        i = bisect.bisect_left(entries, (row, -1))
+        if i >= len(entries):
+            return None
+        return entries[i]
+
+    def _get_entries(self):
+        entries = self._blocks + self._rows
+        entries.sort()
+        return entries
@@ -0,0 +1,274 @@
+# datapyramid.py, multi-resolution decimation of grid-shaped data files
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''
+Multi-resolution pyramid of grid-shaped data.
+
+Grid-shaped data consists of blocks (rows of the map) with the same number
+of points (columns of the map). Level L of the pyramid combines every
+factor**L x factor**L cells of the full resolution data into one cell,
+storing the minimum, maximum and mean of all data columns. NaN values are
+ignored. Level 0 is the data itself.
+
+Levels are built incrementally: every finished block is added to level 1,
+and a row of level L is written as soon as 'factor' rows of level L-1 are
+complete, so viewers can read the coarse levels while a measurement runs.
+
+The pyramid is stored next to the data file:
+    <datafile>.pyr      info: 'QTLPYR1 <factor> <ncols>' followed by a line
+                        'level <L> <ncells>' for every level
+    <datafile>.pyr<L>   float64 rows of level L, shape (ncells, 3, ncols)
+                        with min, max and mean along the second axis
+'''
+
+import os
+import logging
+import numpy
+
+_MAGIC = 'QTLPYR1'
+
+def get_pyramid_filepath(filepath):
+    '''Return the path of the pyramid info sidecar of filepath.'''
+    return filepath + '.pyr'
+
+def get_level_filepath(filepath, level):
+    '''Return the path of the sidecar with level 'level' of filepath.'''
+    return filepath + '.pyr%d' % level
+
+def _reduce_cells(cells, factor):
+    '''
+    Combine every 'factor' neighbouring cells of (min, max, sum, count)
+    arrays with shape (ncells, ncols).
+    '''
+
+    mn, mx, sm, cnt = cells
+    n = (len(mn) + factor - 1) / factor
+    pad = n * factor - len(mn)
+    if pad > 0:
+        ncols = mn.shape[1]
+        nans = numpy.empty((pad, ncols))
+        nans.fill(numpy.nan)
+        zeros = numpy.zeros((pad, ncols))
+        mn = numpy.concatenate((mn, nans))
+        mx = numpy.concatenate((mx, nans))
+        sm = numpy.concatenate((sm, zeros))
+        cnt = numpy.concatenate((cnt, zeros))
+
+    shape = (n, factor, -1)
+    return (numpy.fmin.reduce(mn.reshape(shape), axis=1),
+            numpy.fmax.reduce(mx.reshape(shape), axis=1),
+            sm.reshape(shape).sum(axis=1),
+            cnt.reshape(shape).sum(axis=1))
+
+def _combine_cells(a, b):
+    '''Combine two sets of (min, max, sum, count) arrays cell by cell.'''
+    return (numpy.fmin(a[0], b[0]), numpy.fmax(a[1], b[1]),
+            a[2] + b[2], a[3] + b[3])
+
+class Pyramid():
+    '''
+    Decimation levels of a grid-shaped data file, see module documentation.
+
+    The number of cells per row of the full resolution data is taken from
+    'shape' (cells per row, number of rows) if given, otherwise from the
+    first block. Levels are added until a level fits in 'minsize' x
+    'minsize' cells.
+    '''
+
+    def __init__(self, filepath, shape=None, factor=2, minsize=16):
+        self._filepath = filepath
+        self._shape = shape
+        self._factor = factor
+        self._minsize = minsize
+        self._ncols = None
+        self._ncells = None
+        self._sizes = []
+        self._files = []
+        self._pending = []
+        self._npending = []
+        self._rows = []
+
+    def get_factor(self):
+        return self._factor
+
+    def get_nlevels(self):
+        '''Return the number of levels, including level 0.'''
+        return len(self._sizes) + 1
+
+    def get_level_shape(self, level):
+        '''Return (number of rows, cells per row) of level 'level'.'''
+
+        size = self._sizes[level - 1]
+        fn = get_level_filepath(self._filepath, level)
+        try:
+            nbytes = os.path.getsize(fn)
+        except OSError:
+            nbytes = 0
+        return nbytes / (size * 3 * self._ncols * 8), size
+
+    def _create(self, ncells, ncols):
+        nrows = 0
+        if self._shape is not None:
+            ncells = self._shape[0]
+            if len(self._shape) > 1:
+                nrows = self._shape[1]
+
+        self._ncols = ncols
+        self._ncells = ncells
+        self._sizes = []
+        while max(ncells, nrows) > self._minsize:
+            ncells = (ncells + self._factor - 1) / self._factor
+            nrows = (nrows + self._factor - 1) / self._factor
+            self._sizes.append(ncells)
+        if len(self._sizes) == 0:
+            logging.info('Data too small for a pyramid')
+
+        self._files = []
+        for i in range(len(self._sizes)):
+            self._files.append(open(get_level_filepath(self._filepath, i + 1),
+                'wb'))
+        self._pending = [None] * len(self._sizes)
+        self._npending = [0] * len(self._sizes)
+
+        f = open(get_pyramid_filepath(self._filepath), 'w')
+        try:
+            f.write('%s %d %d\n' % (_MAGIC, self._factor, ncols))
+            for i, size in enumerate(self._sizes):
+                f.write('level %d %d\n' % (i + 1, size))
+        finally:
+            f.close()
+
+    def add_rows(self, rows):
+        '''Add rows of data to the current block.'''
+        self._rows.append(numpy.array(rows, dtype=numpy.float64, ndmin=2))
+
+    def end_row(self):
+        '''Finish the current block and update the levels.'''
+
+        if len(self._rows) == 0:
+            return
+        rows = numpy.concatenate(self._rows)
+        self._rows = []
+
+        if self._ncols is None:
+            self._create(len(rows), rows.shape[1])
+        if len(self._sizes) == 0:
+            return
+
+        # Pad or cut the block to the size of the first block
+        ncells = self._ncells
+        if len(rows) < ncells:
+            nans = numpy.empty((ncells - len(rows), rows.shape[1]))
+            nans.fill(numpy.nan)
+            rows = numpy.concatenate((rows, nans))
+        rows = rows[:ncells]
+
+        valid = ~numpy.isnan(rows)
+        cells = (rows, rows, numpy.where(valid, rows, 0), valid.astype(float))
+        self._add_cells(0, _reduce_cells(cells, self._factor))
+
+    def _add_cells(self, i, cells):
+        '''Add a row of cells, reduced along the row, to level i + 1.'''
+
+        if self._pending[i] is None:
+            self._pending[i] = cells
+        else:
+            self._pending[i] = _combine_cells(self._pending[i], cells)
+        self._npending[i] += 1
+        if self._npending[i] == self._factor:
+            self._write_row(i)
+
+    def _write_row(self, i):
+        mn, mx, sm, cnt = self._pending[i]
+        self._pending[i] = None
+        self._npending[i] = 0
+
+        mean = sm / numpy.where(cnt > 0, cnt, numpy.nan)
+        f = self._files[i]
+        f.write(numpy.concatenate((mn, mx, mean), axis=1).tostring())
+        f.flush()
+
+        if i + 1 < len(self._sizes):
+            self._add_cells(i + 1, _reduce_cells((mn, mx, sm, cnt),
+                self._factor))
+
+    def close(self):
+        '''
+        Finish the current block and write incomplete rows at the edge of
+        every level.
+        '''
+
+        self.end_row()
+        for i in range(len(self._files)):
+            if self._npending[i] > 0:
+                self._write_row(i)
+            self._files[i].close()
+        self._files = []
+
+    def load(self):
+        '''Read the info sidecar, returns False if there is no valid one.'''
+
+        fn = get_pyramid_filepath(self._filepath)
+        if not os.path.exists(fn):
+            return False
+
+        sizes = []
+        try:
+            f = open(fn, 'r')
+            try:
+                magic, factor, ncols = f.readline().split()
+                if magic != _MAGIC:
+                    return False
+                for line in f:
+                    kind, level, size = line.split()
+                    sizes.append(int(size))
+            finally:
+                f.close()
+        except (IOError, ValueError), e:
+            logging.warning('Unable to read pyramid %s: %s', fn, e)
+            return False
+
+        self._factor = int(factor)
+        self._ncols = int(ncols)
+        self._sizes = sizes
+        return True
+
+    def get_level(self, level, region=None):
+        '''
+        Return cells of level 'level' (1 or higher) as an array with shape
+        (rows, cells per row, 3, ncols), containing the min, max and mean.
+
+        'region' is (first row, last row, first cell, last cell) in full
+        resolution units, with python slice semantics (None for no
+        limit); all cells that overlap with it are returned.
+        '''
+
+        if level < 1 or level > len(self._sizes):
+            raise ValueError('Level %d not available' % level)
+
+        nrows, size = self.get_level_shape(level)
+        shape = (size, 3, self._ncols)
+        data = numpy.memmap(get_level_filepath(self._filepath, level),
+                dtype=numpy.float64, mode='r', shape=(nrows, ) + shape) \
+                if nrows > 0 else numpy.zeros((0, ) + shape)
+        if region is None:
+            return data
+
+        scale = self._factor ** level
+        r0, r1, c0, c1 = region
+        rows = slice(r0 and r0 / scale, r1 and (r1 + scale - 1) / scale)
+        cells = slice(c0 and c0 / scale, c1 and (c1 + scale - 1) / scale)
+        return data[rows, cells]
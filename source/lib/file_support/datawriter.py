@@ -0,0 +1,370 @@
+# datawriter.py, buffered writing of data files
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import time
+import gzip
+import logging
+import threading
+import Queue
+
+class StreamCompressor(threading.Thread):
+    '''
+    Gzip-compress text in a background thread while it is being written.
+    Pieces of text are queued with write(); close() waits until everything
+    has been compressed and closes the .gz file.
+    '''
+
+    def __init__(self, filepath, compresslevel=6):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+        self._filepath = filepath
+        self._gzfile = gzip.open(filepath, 'wb', compresslevel)
+        self._queue = Queue.Queue()
+        self._error = None
+
+        self.start()
+
+    def get_filepath(self):
+        return self._filepath
+
+    def write(self, text):
+        '''Queue text for compression.'''
+        self._queue.put(text)
+
+    def run(self):
+        while True:
+            text = self._queue.get()
+            if text is None:
+                break
+            if self._error is not None:
+                continue
+
+            try:
+                self._gzfile.write(text)
+            except Exception, e:
+                self._error = e
+
+        try:
+            self._gzfile.close()
+        except Exception, e:
+            if self._error is None:
+                self._error = e
+
+    def close(self):
+        '''
+        Wait for the queued text to be compressed and close the file.
+        Returns True on success.
+        '''
+
+        self._queue.put(None)
+        self.join()
+
+        if self._error is not None:
+            logging.error('Compressing to %s failed: %s',
+                    self._filepath, self._error)
+            return False
+        return True
+
+class FileWriterThread(threading.Thread):
+    '''
+    Write text to a file in a background thread, so a slow disk does not
+    hold up the thread producing the data.
+
+    Pieces of text are queued with write(). The queue is bounded: when it
+    holds maxsize pieces, write() blocks until the thread has caught up.
+    If writing fails, the error is raised as an IOError by the next call
+    to write() or sync().
+
+    If a compressor (StreamCompressor) is given, the text is passed on to
+    it after it has been written to the file.
+
+    Functions queued with call() are called by the thread once the text
+    queued before them has been written.
+    '''
+
+    def __init__(self, f, maxsize=64, compressor=None):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+        self._file = f
+        self._compressor = compressor
+        self._queue = Queue.Queue(maxsize)
+        self._error = None
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._max_depth = 0
+        self._nbytes = 0
+        self._nwrites = 0
+        self._write_time = 0.0
+
+        self.start()
+
+    def _check_error(self):
+        if self._error is not None:
+            raise IOError('Writing to %s failed: %s' % \
+                    (getattr(self._file, 'name', 'file'), self._error))
+
+    def write(self, text):
+        '''Queue text to be written, blocks if the queue is full.'''
+
+        self._check_error()
+        t = time.time()
+        self._lock.acquire()
+        self._pending.append(t)
+        self._lock.release()
+        self._queue.put((t, text))
+
+        depth = self._queue.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+
+    def call(self, func):
+        '''
+        Queue func to be called by the thread after the text queued before
+        it has been written, blocks if the queue is full.
+        '''
+
+        self._check_error()
+        t = time.time()
+        self._lock.acquire()
+        self._pending.append(t)
+        self._lock.release()
+        self._queue.put((t, func))
+
+    def sync(self):
+        '''Wait until all queued text has been written to the file.'''
+        self._queue.join()
+        self._check_error()
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+
+            t, text = item
+            if callable(text):
+                try:
+                    text()
+                except Exception, e:
+                    logging.warning('Call after writing to %s failed: %s',
+                            getattr(self._file, 'name', 'file'), e)
+            elif self._error is None:
+                try:
+                    start = time.time()
+                    self._file.write(text)
+                    self._file.flush()
+                    self._write_time += time.time() - start
+                    self._nbytes += len(text)
+                    self._nwrites += 1
+                    if self._compressor is not None:
+                        self._compressor.write(text)
+                except Exception, e:
+                    self._error = e
+
+            self._lock.acquire()
+            self._pending.remove(t)
+            self._lock.release()
+            self._queue.task_done()
+
+    def close(self):
+        '''
+        Write all queued text and stop the thread; the file is not closed.
+        Returns False if writing failed.
+        '''
+
+        self._queue.put(None)
+        self.join()
+
+        ret = True
+        if self._error is not None:
+            logging.error('Writing to %s failed: %s',
+                    getattr(self._file, 'name', 'file'), self._error)
+            ret = False
+        if self._compressor is not None:
+            ret = self._compressor.close() and ret
+        return ret
+
+    def get_stats(self):
+        '''
+        Return a dictionary with statistics:
+            queue_depth: number of pieces of text waiting to be written
+            max_queue_depth: the largest queue depth seen
+            queue_size: the maximum queue depth before write() blocks
+            lag: time in seconds the oldest waiting piece has been queued
+            nbytes: number of bytes written
+            nwrites: number of pieces of text written
+            write_time: total time in seconds spent writing
+            error: error message if writing failed, otherwise None
+        '''
+
+        self._lock.acquire()
+        if len(self._pending) > 0:
+            lag = time.time() - self._pending[0]
+        else:
+            lag = 0.0
+        self._lock.release()
+
+        if self._error is not None:
+            error = str(self._error)
+        else:
+            error = None
+
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self._max_depth,
+            'queue_size': self._queue.maxsize,
+            'lag': lag,
+            'nbytes': self._nbytes,
+            'nwrites': self._nwrites,
+            'write_time': self._write_time,
+            'error': error,
+        }
+
+class BufferedWriter():
+    '''
+    Collect text written to a data file and pass it on to the file in
+    batches. The buffer is flushed when one of the limits of the flush
+    policy is reached:
+        rows: number of buffered rows
+        nbytes: number of buffered bytes
+        interval: time in seconds since the last flush
+    A limit of None disables that check, a limit of 0 flushes after every
+    write.
+
+    Only complete pieces of text passed to write() end up in the file, so
+    readers of the file (e.g. gnuplot) never see half a line.
+
+    If a compressor (StreamCompressor) is given, all flushed text is also
+    passed on to it. If a thread (FileWriterThread) is given, flushed text
+    is handed to that thread instead of written directly; the thread takes
+    care of the compressor then.
+    '''
+
+    def __init__(self, f, rows=None, nbytes=None, interval=None,
+            compressor=None, thread=None):
+        self._file = f
+        self._compressor = compressor
+        self._thread = thread
+        self._buffer = []
+        self._buffer_rows = 0
+        self._buffer_bytes = 0
+        self._position = 0
+        self._last_flush = time.time()
+        self.set_policy(rows=rows, nbytes=nbytes, interval=interval)
+
+    def set_policy(self, rows=None, nbytes=None, interval=None):
+        '''Set the flush policy, see the class documentation.'''
+        self._rows = rows
+        self._nbytes = nbytes
+        self._interval = interval
+
+    def get_policy(self):
+        '''Return the flush policy as a dictionary.'''
+        return {
+            'rows': self._rows,
+            'nbytes': self._nbytes,
+            'interval': self._interval,
+        }
+
+    def get_file(self):
+        return self._file
+
+    def get_compressor(self):
+        return self._compressor
+
+    def get_thread(self):
+        return self._thread
+
+    def get_position(self):
+        '''Return the number of bytes written, including buffered ones.'''
+        return self._position
+
+    def write(self, text, nrows=0):
+        '''
+        Add text, containing nrows data rows, to the buffer and flush if
+        required by the policy.
+        '''
+
+        self._buffer.append(text)
+        self._buffer_rows += nrows
+        self._buffer_bytes += len(text)
+        self._position += len(text)
+
+        if self._rows is not None and self._buffer_rows >= self._rows:
+            self.flush()
+        elif self._nbytes is not None and self._buffer_bytes >= self._nbytes:
+            self.flush()
+        elif self._interval is not None and \
+                time.time() - self._last_flush >= self._interval:
+            self.flush()
+
+    def flush(self):
+        '''Write the buffered text to the file and flush the file.'''
+
+        self._last_flush = time.time()
+        if len(self._buffer) == 0:
+            return
+
+        text = ''.join(self._buffer)
+        self._buffer = []
+        self._buffer_rows = 0
+        self._buffer_bytes = 0
+
+        if self._thread is not None:
+            self._thread.write(text)
+            return
+
+        self._file.write(text)
+        self._file.flush()
+        if self._compressor is not None:
+            self._compressor.write(text)
+
+    def call(self, func):
+        '''
+        Flush and call func once the text has been written to the file.
+        With a writer thread func is called by that thread, so this does not
+        wait for the disk.
+        '''
+
+        self.flush()
+        if self._thread is not None:
+            self._thread.call(func)
+        else:
+            func()
+
+    def sync(self):
+        '''Flush and wait until the text has been written to the file.'''
+        self.flush()
+        if self._thread is not None:
+            self._thread.sync()
+
+    def close(self):
+        '''
+        Flush the buffer, wait for the writer thread and finish compression,
+        if any. The file itself is not closed. Returns False if writing or
+        compression failed.
+        '''
+
+        self.flush()
+        if self._thread is not None:
+            return self._thread.close()
+        if self._compressor is not None:
+            return self._compressor.close()
+        return True
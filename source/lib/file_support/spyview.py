@@ -13,6 +13,9 @@ class SpyView():
         for writing a '.meta.txt' file as used by spyview.
         '''
 
+        if len(self._data.get_dimensions()) == 0:
+            self._data.read_header()
+
         ncoords = self._data.get_ncoordinates()
         if ncoords not in (2,3):
             logging.error('this function currently only supports data files \
@@ -45,6 +48,9 @@ class SpyView():
             self._meta_info['zend'] = 0
             self._meta_info['zsize'] = 1
 
+        if ncoords == 2 and None in self._meta_info.values():
+            self._get_stream_info()
+
         nvals = self._data.get_nvalues()
         self._meta_info['nvals'] = nvals
 
@@ -54,6 +60,34 @@ class SpyView():
 
         return self._meta_info
 
+    def _get_stream_info(self):
+        '''
+        Fill in missing x and y information by streaming through the blocks
+        of the data, assuming every block is one sweep of x.
+        '''
+
+        first, last, nblocks = None, None, 0
+        for info, rows in self._data.iter_blocks():
+            if first is None:
+                first = info
+            last = info
+            nblocks += 1
+
+        if first is None:
+            return
+
+        found = {
+            'xstart': first['coordinates'][0][0],
+            'xend': first['coordinates'][0][1],
+            'xsize': first['npoints'],
+            'ystart': first['coordinates'][1][0],
+            'yend': last['coordinates'][1][0],
+            'ysize': nblocks,
+        }
+        for key, val in found.iteritems():
+            if self._meta_info.get(key, None) is None:
+                self._meta_info[key] = val
+
     def write_meta_file(self):
         '''
         Writes meta-data file for spyview. The name will be
@@ -214,6 +214,24 @@ class Function:
         if logy:
             plt.yscale('log')
 
+def fit_blocks(func, data, xcol, ycol, p0, fixed=[]):
+    '''
+    Fit Function 'func' to every block of a Data object, reading the data
+    block by block with data.iter_blocks().
+
+    Parameters:
+    - xcol, ycol: columns to use as x and y data
+    - p0, fixed: starting parameters and fixed parameters, see Function.fit
+
+    Generates (info, params, errors) for every block, with info the block
+    information from iter_blocks().
+    '''
+
+    for info, rows in data.iter_blocks():
+        func.set_data(rows[:, xcol], rows[:, ycol])
+        params = func.fit(p0, fixed)
+        yield info, params, func.get_fit_errors()
+
 class Fit3D(Function):
 
     def __init__(self, x, y, z, *args, **kwargs):
@@ -396,7 +396,7 @@ class parspace(object):
 		for i in self.xs:
 			cnt+=1
 			data.add_coordinate('{%s} ({%s})' % (i.label,i.unit),
-				size=abs((i.end - i.begin) / i.stepsize),
+				size=int(round(abs((i.end - i.begin) / i.stepsize))) + 1,
 				start=i.begin,
 				end=i.end
 				)
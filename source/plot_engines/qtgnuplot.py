@@ -351,7 +351,12 @@ class _QTGnuPlot():
         Perform an update of the plot.
         '''
 
-        cmd = self.create_plot_command()  
+        # Make sure gnuplot sees the rows still buffered by the Data objects
+        for datadict in self._data:
+            if 'data' in datadict:
+                datadict['data'].flush()
+
+        cmd = self.create_plot_command()
         
         #import ipdb
         #ipdb.set_trace()      
@@ -406,6 +411,43 @@ class _QTGnuPlot():
         datadict = _parse_style_string(datadict['style'], datadict)
         del datadict['style']
 
+    def _get_data_filepath(self, data, fullpath):
+        '''
+        Return the path of the file gnuplot reads the data from. gnuplot can
+        not read HDF5, so data written with the 'hdf5' backend is exported
+        to a text file next to the data file first; after that only new
+        rows are appended to it.
+        '''
+
+        filepath = data.get_filepath()
+        if data.get_backend() == 'hdf5':
+            filepath = data.update_text_export(filepath + '.plot.dat')
+            if filepath is None:
+                return None
+        if not fullpath:
+            filepath = os.path.basename(filepath)
+        return filepath.replace('\\','/')
+
+    def _get_binary_file_options(self, data, startblock=0):
+        '''
+        Return gnuplot options to read a data file written with the 'binary'
+        backend, starting at block startblock. Every block is a record.
+        '''
+
+        ncols = data.get_ndimensions()
+        dt = np.dtype(data.get_binary_dtype())
+        nblocks = data.get_nblocks()
+        sizes = [data.get_block_size(i) for i in range(nblocks + 1)]
+        skip = data.get_binary_header_size() + \
+                sum(sizes[:startblock]) * ncols * dt.itemsize
+        records = [str(n) for n in sizes[startblock:] if n > 0]
+        if len(records) == 0:
+            return None
+
+        fmt = (r'%' + self._DATA_TYPES[dt]) * ncols
+        return " binary skip=%d format='%s' record=%s" % \
+                (skip, fmt, ':'.join(records))
+
     def _get_trace_options(self, datadict, defaults={}):
         datadict = datadict.copy()
         for key, val in defaults.iteritems():
@@ -586,11 +628,9 @@ class Plot2D(plot.Plot2DBase, _QTGnuPlot):
             traceofs = datadict.get('traceofs', 0)
             self._check_style_options(datadict)
 
-            if fullpath:
-                filepath = data.get_filepath()
-            else:
-                filepath = data.get_filename()
-            filepath = filepath.replace('\\','/')
+            filepath = self._get_data_filepath(data, fullpath)
+            if filepath is None:
+                continue
 
             if len(coorddims) == 0:
                 using = '($%d+%f+%f*column(-1))' % (valdim + 1, ofs, traceofs)
@@ -618,6 +658,13 @@ class Plot2D(plot.Plot2DBase, _QTGnuPlot):
 
             startpoint = max(0, npoints_last_block - self._maxpoints)
             startblock = max(0, nblocks - self._maxtraces)
+            binary = ''
+            if data.get_backend() == 'binary':
+                # Skip the first blocks instead of listing all records
+                binary = self._get_binary_file_options(data, startblock)
+                if binary is None:
+                    continue
+                startblock = 0
             if len(coorddims) == 0:
                 every = "::%d" % (startpoint)
             else:
@@ -637,8 +684,8 @@ class Plot2D(plot.Plot2DBase, _QTGnuPlot):
             else:
                 first = False
 
-            s += '"%s" using %s every %s' % \
-                (str(filepath), using, every)
+            s += '"%s"%s using %s every %s' % \
+                (str(filepath), binary, using, every)
             s += self._get_trace_options(datadict)
             s += ' axes %s' % axes
 
@@ -896,11 +943,9 @@ class Plot3D(plot.Plot3DBase, _QTGnuPlot):
                 logging.error('Unable to plot without two coordinate columns')
                 continue
 
-            if fullpath:
-                filepath = data.get_filepath()
-            else:
-                filepath = data.get_filename()
-            filepath = filepath.replace('\\','/')
+            filepath = self._get_data_filepath(data, fullpath)
+            if filepath is None:
+                continue
 
             using = '%d:%d:($%d+%f+%f*column(-1)+%f*column(-2))' % (coorddims[0] + 1, coorddims[1] + 1, valdim + 1, ofs, traceofs, surfofs)
 
@@ -914,12 +959,17 @@ class Plot3D(plot.Plot3DBase, _QTGnuPlot):
             else:
                 everystr = ''
 
+            binary = ''
+            if data.get_backend() == 'binary':
+                binary = self._get_binary_file_options(data)
+                if binary is None:
+                    continue
 
             if not first:
                 s += ', '
             else:
                 first = False
-            s += '"%s" using %s %s' % (str(filepath), using, everystr)
+            s += '"%s"%s using %s %s' % (str(filepath), binary, using, everystr)
 
             defaults = {
                 'with': self._default_with
@@ -41,6 +41,23 @@ def version():
         str = 'NO VERSION FILE'
     return str
 
+# instrument imports qt, so import it when these are called
+
+def wait_ramps(timeout=None):
+    '''Wait for all instrument ramps, see instrument.wait_ramps().'''
+    import instrument
+    return instrument.wait_ramps(timeout)
+
+def abort_ramps():
+    '''Stop all instrument ramps, see instrument.abort_ramps().'''
+    import instrument
+    return instrument.abort_ramps()
+
+def gather(*futures, **kwargs):
+    '''Wait for futures and return their results, see instrument.gather().'''
+    import instrument
+    return instrument.gather(*futures, **kwargs)
+
 class qApp:
     '''Class to fix a bug in matplotlib.pyplot back-end detection.'''
     @staticmethod